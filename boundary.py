@@ -0,0 +1,225 @@
+#######################################################
+#
+# Map the boundary between safe passage and impact.
+#
+#######################################################
+
+import sys
+import json
+import multiprocessing
+from sweep import Scenario, run_scenario
+from pedac import get_option
+from graphs import BoundaryGraph
+
+# Values used for the axes that are not being mapped.
+DEFAULTS = dict(ped_x=35.0, ped_y=-7.0, ped_speed=1.67, car_speed=13.9)
+
+
+def make_scenario(params, paths=None, time_out=60000):
+    """
+    Scenario for a point in (ped_x, ped_y, ped_speed, car_speed) space.
+    The pedestrian walks in +y, the car drives in +x from the origin.
+    """
+    name = "boundary_" + "_".join("{}={:.4f}".format(k, params[k]) for k in sorted(params))
+    return Scenario(name, car=(0, 0, params['car_speed'], 0),
+        ped=(params['ped_x'], params['ped_y'], 0, params['ped_speed']),
+        paths=paths, time_out=time_out)
+
+
+def impact_at(job):
+    """
+    Pool entry point: does the car hit the pedestrian at this point?
+    """
+    params, paths, time_out = job
+    return run_scenario(make_scenario(params, paths, time_out))['impact']
+
+
+class BoundaryMap(object):
+    """
+    Maps where the outcome changes over two of the axes by refining a coarse grid.
+    Every cell whose corners disagree is split in four until 'depth' levels deep,
+    the rest of the cells are never looked at again.
+    """
+    def __init__(self, x_axis, x_range, y_axis, y_range, fixed=None, coarse=8, depth=4,
+            paths=None, time_out=60000, processes=None):
+        """
+        \param x_axis, y_axis: names from DEFAULTS
+        \param x_range, y_range: (low, high)
+        \param fixed: values for the other axes, defaults from DEFAULTS
+        \param coarse: cells per side of the first grid
+        """
+        for axis in (x_axis, y_axis):
+            if axis not in DEFAULTS:
+                raise ValueError("Unknown axis '{}', use one of {}".format(axis, sorted(DEFAULTS)))
+        self.x_axis = x_axis
+        self.y_axis = y_axis
+        self.x_range = x_range
+        self.y_range = y_range
+        self.fixed = dict(DEFAULTS)
+        if fixed != None:
+            self.fixed.update(fixed)
+        self.coarse = coarse
+        self.depth = depth
+        self.paths = paths
+        self.time_out = time_out
+        self.processes = processes
+        self.resolution = coarse*2**depth # finest cells per side
+        self.outcomes = dict() # (i, j) on the finest grid -> impact
+        self.leaves = list() # (i, j, size) on the finest grid
+        self.runs = 0
+
+    def point(self, i, j):
+        """
+        Axis values of finest grid index (i, j).
+        """
+        x = self.x_range[0] + (self.x_range[1] - self.x_range[0])*i/float(self.resolution)
+        y = self.y_range[0] + (self.y_range[1] - self.y_range[0])*j/float(self.resolution)
+        return x, y
+
+    def evaluate(self, pool, points):
+        """
+        Run every point not evaluated yet.
+        """
+        points = [p for p in set(points) if p not in self.outcomes]
+        jobs = list()
+        for i, j in points:
+            params = dict(self.fixed)
+            params[self.x_axis], params[self.y_axis] = self.point(i, j)
+            jobs.append((params, self.paths, self.time_out))
+        if pool == None:
+            outcomes = [impact_at(job) for job in jobs]
+        else:
+            outcomes = pool.map(impact_at, jobs)
+        for p, impact in zip(points, outcomes):
+            self.outcomes[p] = impact
+        self.runs += len(jobs)
+
+    def corners(self, cell):
+        i, j, size = cell
+        return [(i, j), (i + size, j), (i, j + size), (i + size, j + size)]
+
+    def mixed(self, cell):
+        outcomes = [self.outcomes[c] for c in self.corners(cell)]
+        return any(outcomes) and not all(outcomes)
+
+    def run(self):
+        """
+        Refine until every mixed cell is at the finest level.
+        """
+        size = 2**self.depth
+        cells = [(i*size, j*size, size) for i in range(self.coarse) for j in range(self.coarse)]
+        pool = None if self.processes == 1 else multiprocessing.Pool(self.processes)
+        try:
+            self.evaluate(pool, [c for cell in cells for c in self.corners(cell)])
+            while len(cells) > 0:
+                split = list()
+                for cell in cells:
+                    if cell[2] > 1 and self.mixed(cell):
+                        i, j, size = cell
+                        half = size//2
+                        split.extend([(i, j, half), (i + half, j, half), (i, j + half, half),
+                            (i + half, j + half, half)])
+                    else:
+                        self.leaves.append(cell)
+                self.evaluate(pool, [c for cell in split for c in self.corners(cell)])
+                cells = split
+        finally:
+            if pool != None:
+                pool.close()
+                pool.join()
+        return self
+
+    def heatmap(self):
+        """
+        Impact fraction on the finest grid, each leaf filled with the mean of its corners.
+        \return rows of values, one row per y
+        """
+        n = self.resolution
+        grid = [[0.0]*n for _ in range(n)]
+        for cell in self.leaves:
+            i, j, size = cell
+            value = sum(1.0 for c in self.corners(cell) if self.outcomes[c])/4.0
+            for a in range(i, i + size):
+                for b in range(j, j + size):
+                    grid[b][a] = value
+        return grid
+
+    def segments(self):
+        """
+        Boundary segments through the mixed cells (marching squares on the corner outcomes).
+        """
+        segments = list()
+        for cell in self.leaves:
+            if not self.mixed(cell):
+                continue
+            i, j, size = cell
+            c00, c10, c01, c11 = self.corners(cell)
+            edges = [(c00, c10), (c10, c11), (c11, c01), (c01, c00)]
+            crossings = [((a[0] + b[0])/2.0, (a[1] + b[1])/2.0) for a, b in edges
+                if self.outcomes[a] != self.outcomes[b]]
+            for k in range(0, len(crossings) - 1, 2):
+                segments.append((crossings[k], crossings[k + 1]))
+        return segments
+
+    def polylines(self):
+        """
+        The boundary segments chained into polylines, in axis units.
+        """
+        ends = dict()
+        for seg in self.segments():
+            for p in seg:
+                ends.setdefault(p, list()).append(seg)
+        used = set()
+        lines = list()
+        for seg in self.segments():
+            if seg in used:
+                continue
+            used.add(seg)
+            line = [seg[0], seg[1]]
+            for forward in (True, False):
+                while True:
+                    tip = line[-1] if forward else line[0]
+                    nxt = [s for s in ends[tip] if s not in used]
+                    if len(nxt) == 0:
+                        break
+                    used.add(nxt[0])
+                    other = nxt[0][1] if nxt[0][0] == tip else nxt[0][0]
+                    if forward:
+                        line.append(other)
+                    else:
+                        line.insert(0, other)
+            lines.append([self.point(*p) for p in line])
+        return lines
+
+    def save(self, filename):
+        """
+        Write the evaluated points and the boundary as JSON.
+        """
+        points = [dict(zip((self.x_axis, self.y_axis), self.point(*p)), impact=impact)
+            for p, impact in sorted(self.outcomes.items())]
+        with open(filename, 'w') as out:
+            json.dump(dict(x_axis=self.x_axis, y_axis=self.y_axis, fixed=self.fixed, runs=self.runs,
+                points=points, boundary=self.polylines()), out)
+
+
+def main():
+    """
+    python boundary.py [--x=ped_x] [--x-range=20:60] [--y=ped_y] [--y-range=-15:-1]
+        [--coarse=8] [--depth=4] [--processes=N] [--out=boundary]
+    """
+    options = sys.argv[1:]
+    x_range = [float(v) for v in get_option(options, '--x-range', '20:60').split(':')]
+    y_range = [float(v) for v in get_option(options, '--y-range', '-15:-1').split(':')]
+    processes = get_option(options, '--processes')
+    bmap = BoundaryMap(get_option(options, '--x', 'ped_x'), x_range, get_option(options, '--y', 'ped_y'),
+        y_range, coarse=int(get_option(options, '--coarse', 8)), depth=int(get_option(options, '--depth', 4)),
+        processes=int(processes) if processes != None else None).run()
+    out = get_option(options, '--out', 'boundary')
+    bmap.save(out + '.json')
+    BoundaryGraph(bmap, filename=out + '-graph.html')
+    print("Mapped the boundary with {} runs ({} for the full {}x{} grid)".format(bmap.runs,
+        (bmap.resolution + 1)**2, bmap.resolution + 1, bmap.resolution + 1))
+
+
+if __name__ == "__main__":
+    main()
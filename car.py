@@ -6,11 +6,13 @@
 #
 #######################################################
 
+import functools
 from objects import *
 
 class Controller(object):
     def __init__(self, car):
         self.car = car
+        self.monitor = None # latency.LatencyMonitor timing the decisions
 
     def algorithm(self, time_to_impact, time_to_stop, current_dist,
             car_speed, projected_dist, rate_approaching):
@@ -43,7 +45,10 @@ class Controller(object):
         #if self.car.velocity.speed()*1000.0 < 10:
         #    self.apply_gas()
 
-        apply_break, how_much = self.p_hit_ped(ped_pos, ped_vel)
+        if self.monitor != None:
+            apply_break, how_much = self.monitor.call('p_hit_ped', self.p_hit_ped, ped_pos, ped_vel)
+        else:
+            apply_break, how_much = self.p_hit_ped(ped_pos, ped_vel)
 
         if apply_break:
             self.apply_break(how_much)
@@ -81,7 +86,13 @@ class Controller(object):
         tts = self.car.velocity.speed()/max_decell # (mm/ms)/(mm/ms^2)=ms
 
         # Document the rate we are approaching
-        self.car.sim.approach_rate_graph.append(rate*1000)
+        if self.car.sim.recording:
+            self.car.sim.approach_rate_graph.append(rate*1000)
+            self.car.sim.approach_rate_time.append(self.car.time)
+
+        if self.car.sim.quiet:
+            return self.run_algorithm(time_to_impact, tts, dist, self.car.velocity.speed()*1000,
+                next_dist, rate*1000)
 
         print("\n\nCar pos: ********************************** {:<30} (m)".format(str(self.car.pos)))
         print("Ped pos: ********************************** {:<30} (m)".format(str(self.car.sensor.ped.pos)))
@@ -97,9 +108,17 @@ class Controller(object):
         print("\nTime: {:.4f} (s)".format(self.car.time/1000.0))
         print("\n________________________________________________________________________________")
 
-        return self.algorithm(time_to_impact, tts, dist, self.car.velocity.speed()*1000,
+        return self.run_algorithm(time_to_impact, tts, dist, self.car.velocity.speed()*1000,
             next_dist, rate*1000)
-        
+
+    def run_algorithm(self, *args):
+        """
+        Call the algorithm, timing it when there is a latency monitor.
+        """
+        if self.monitor != None:
+            return self.monitor.call('algorithm', self.algorithm, *args)
+        return self.algorithm(*args)
+
     def projection(self, pos, vel, time):
         """
         \param time: time in ms for projection
@@ -194,20 +213,28 @@ class EfficiencyGhostCar(SpaceObject):
         self.start_pos = car.pos
         self.distance = 0
 
-    def tick(self):
-        self.move()
+    def tick(self, ticks=1):
+        """
+        \param ticks: number of ticks since the last call. The ghost never
+            accelerates so it can be moved over several ticks at once.
+        """
+        ms = ticks*self.dt
+        if ms == 1:
+            self.move()
+        else:
+            v = self.velocity
+            self.pos += Pos(v.dx*ms, v.dy*ms, v.dz*ms)
         if self.car.sensor.ped == None:
-            self.time += 1
+            self.time += ms
             return
         if self.pos.x < self.car.sensor.ped.pos.x:
-            self.time += 1
-        self.distance = max(self.car.distance_to_ped_graph)
+            self.time += ms
 
     def get_efficiency_baseline(self):
         """
         Call this at the end of the simulation to get baseline for efficiency.
         """
-        self.distance = max(self.car.distance_to_ped_graph)
+        self.distance = self.car.max_distance
         return self.distance/(self.time/1000.0)
 
 
@@ -218,55 +245,79 @@ class Car(SpaceObject):
         self.depth = depth
         self.controller = Controller(self)
         self.sensor = Sensor(self)
-        self.sensor_timer = 0
         self.break_on = False
         self.acceleration_graph = list()
         self.distance_to_ped_graph = list()
+        self.brake_graph = list()
+        self.max_distance = 0 # largest distance to the pedestrian seen by the sensor
+        self.packet_time = None # time of the last sensor packet
         self.efficiency_time = 0 # to compare to ghost car
         self.safety_buffer = 5 # Meters past ped.pos.x for declring safe passage
 
     def __str__(self):
         return "Name: {}, Pos: {}, Vel: {}, Hit Ped: {}".format(self.name, self.pos, self.velocity*1000.0, self.impact)
 
-    def effiency_calc(self):
+    def effiency_calc(self, ticks=1):
+        """
+        \param ticks: number of ticks since the last calculation.
+        """
         if self.sensor.ped == None:
-            self.efficiency_time += 1
+            self.efficiency_time += ticks*self.dt
             return
         if self.pos.x < self.sensor.ped.pos.x:
-            self.efficiency_time += 1
+            self.efficiency_time += ticks*self.dt
 
-    def tick_every_tick(self):
+    def record(self):
         """
-        Operations done EVERY tick.
+        Document the acceleration, the break and the distance to the pedestrian.
         """
-        # move the car and change the velocity by some amount (optional)
-        self.move()
-        self.time += 1
-
-        # do effiency calculations.
-        self.effiency_calc()
-
-        # document the cars acceleration
         acc = self.acceleration.speed()
         self.acceleration_graph.append(acc)
+        self.brake_graph.append(1 if self.break_on else 0)
 
-        # document the distance to the pedestrian
+        di = self.track_distance()
+        self.distance_to_ped_graph.append(di)
+
+    def track_distance(self):
+        """
+        Keep up the largest distance to the pedestrian (needed for the efficiency).
+        """
         di = self.sensor.get_distance()
         if di == None:
-            di = 0
-        self.distance_to_ped_graph.append(di)
+            return 0
+        if di > self.max_distance:
+            self.max_distance = di
+        return di
 
-        # check to see if impact with ped has occured after moving
+    def check_impact(self):
+        """
+        Check to see if impact with ped has occured after moving.
+        """
         self.impact = self.sensor.check_impact()
 
-        # check to see if we have passed the pedestrian and the coast is clear
-        self.sensor.check_safe()
+    def schedule(self, scheduler, rates, record=True):
+        """
+        Register the work the car does with the simulation scheduler.
+        \param rates: dict of task name to (period, phase) in ticks
+        \param record: document the graphs, otherwise only the largest distance is kept
+        """
+        period, phase = rates['efficiency']
+        scheduler.add('efficiency', functools.partial(self.effiency_calc, period), period, phase, order=20)
+        if record:
+            scheduler.add('car_recorder', self.record, *rates['recorder'], order=30)
+        else:
+            scheduler.add('car_distance', self.track_distance, *rates['recorder'], order=30)
+        scheduler.add('impact', self.check_impact, *rates['impact'], order=40)
+        scheduler.add('safe', self.sensor.check_safe, *rates['safe'], order=50)
+        scheduler.add('sensor', self.tick_sensor_packets, *rates['sensor'], order=60)
 
     def tick_sensor_packets(self):
         """
         Operations done when the car recieves packets from the sensor.
-        Every 100 ms.
+        Every sensor period (100 ms by default).
         """
+        self.packet_time = self.time
+
         # get the distance and the relative velocity to the ped
         dist = self.sensor.get_distance()
         ped_vel = self.sensor.get_ped_velocity()
@@ -281,17 +332,9 @@ class Car(SpaceObject):
         self.controller.take_action(ped_vel, ped_pos)
 
     def tick(self):
-        # Do the operations that happen EVERY tick
-        self.tick_every_tick()
-
-        # the below info is relayed from the sensor which only sends packets every 100ms
-        if self.sensor_timer < 100:
-            self.sensor_timer += 1
-            return
-        self.sensor_timer = 0
-
-        # Do the operations that happen on ticks sensor info is recieved
-        self.tick_sensor_packets()
+        # move the car and change the velocity by some amount (optional)
+        self.move()
+        self.time += self.dt
 
     def apply_break(self, g=.7):
         """
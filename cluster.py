@@ -0,0 +1,265 @@
+#######################################################
+#
+# Coordinator and workers for running sweeps on many hosts.
+#
+# Protocol: one JSON object per line over TCP, every request gets one reply.
+#   {"op": "pull", "worker": id}          -> {"batch": id, "scenarios": [...]}
+#                                            | {"wait": seconds} | {"done": true}
+#   {"op": "heartbeat", "worker": id}     -> {"ok": true}
+#   {"op": "result", "worker": id, "batch": id, "results": [...]} -> {"ok": true}
+#
+#######################################################
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import socketserver
+from collections import deque
+from sweep import Scenario, _run_safe, grid_scenarios
+from pedac import get_option
+from metrics import SweepMetrics, MetricsFileWriter
+from report import ResultsFile
+
+
+class Coordinator(object):
+    """
+    Hands out batches of scenarios and collects the results.
+    A batch whose worker stops sending heartbeats is put back in the queue.
+    Results are keyed by scenario name so a batch that ends up running twice is only counted once.
+    """
+    def __init__(self, scenarios, batch_size=8, lease=30.0, host='127.0.0.1', port=0, metrics=None,
+            results_file=None):
+        """
+        \param lease: seconds a worker may go without a heartbeat before its work is re-queued
+        \param port: 0 picks a free port, see self.port
+        \param results_file: append every result to this file as a JSON line (see report.py)
+        """
+        self.lock = threading.Lock()
+        self.batches = dict()
+        self.pending = deque()
+        scenarios = list(scenarios)
+        for i in range(0, len(scenarios), batch_size):
+            batch_id = i//batch_size
+            self.batches[batch_id] = [s.to_dict() for s in scenarios[i:i + batch_size]]
+            self.pending.append(batch_id)
+        self.leases = dict() # batch id -> (worker, deadline)
+        self.finished = set() # batch ids
+        self.results = dict() # scenario name -> result
+        self.lease = lease
+        self.writer = ResultsFile(results_file) if results_file != None else None
+        self.requeued = 0
+        self.metrics = metrics if metrics != None else SweepMetrics()
+        self.metrics.add_scenarios(len(scenarios))
+        self.done = threading.Event()
+        if len(self.batches) == 0:
+            self.done.set()
+
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    reply = coordinator.handle(json.loads(line.decode('utf-8')))
+                    self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+        self.threads = list()
+
+    def start(self):
+        for target in (self.server.serve_forever, self.reap):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        self.done.set()
+        self.server.shutdown()
+        self.server.server_close()
+        with self.lock:
+            if self.writer != None:
+                self.writer.close()
+                self.writer = None
+
+    def handle(self, request):
+        op = request.get('op')
+        worker = request.get('worker')
+        with self.lock:
+            if op == 'pull':
+                return self.pull(worker)
+            if op == 'heartbeat':
+                deadline = time.time() + self.lease
+                for batch_id, lease in self.leases.items():
+                    if lease[0] == worker:
+                        self.leases[batch_id] = (worker, deadline)
+                return dict(ok=True)
+            if op == 'result':
+                self.collect(request['batch'], request['results'])
+                return dict(ok=True)
+        return dict(error="unknown op {}".format(op))
+
+    def pull(self, worker):
+        while len(self.pending) > 0:
+            batch_id = self.pending.popleft()
+            if batch_id in self.finished:
+                continue
+            self.leases[batch_id] = (worker, time.time() + self.lease)
+            return dict(batch=batch_id, scenarios=self.batches[batch_id])
+        if self.done.is_set():
+            return dict(done=True)
+        # Everything is handed out but could still come back if a worker dies.
+        return dict(wait=min(self.lease/4.0, 1.0))
+
+    def collect(self, batch_id, results):
+        if batch_id in self.finished:
+            return
+        self.finished.add(batch_id)
+        self.leases.pop(batch_id, None)
+        for result in results:
+            if result['name'] in self.results:
+                continue
+            self.results[result['name']] = result
+            if self.writer != None:
+                self.writer.write(result)
+            if 'error' in result:
+                self.metrics.scenario_failed(result['worker'])
+            else:
+                self.metrics.scenario_done(result['worker'], result['ticks'], result['elapsed'],
+                    result['impact'])
+        if len(self.finished) == len(self.batches):
+            self.done.set()
+
+    def reap(self):
+        """
+        Put the batches of workers that went quiet back in the queue.
+        """
+        while not self.done.wait(min(self.lease/4.0, 1.0)):
+            now = time.time()
+            with self.lock:
+                for batch_id, lease in list(self.leases.items()):
+                    if lease[1] < now:
+                        del self.leases[batch_id]
+                        self.pending.appendleft(batch_id)
+                        self.requeued += 1
+
+    def wait(self, timeout=None):
+        """
+        Block until every batch has a result. Returns the results by scenario name.
+        """
+        self.done.wait(timeout)
+        return self.results
+
+
+class Worker(object):
+    """
+    Pulls batches from a coordinator, runs them and sends the results back.
+    """
+    def __init__(self, host='127.0.0.1', port=9436, heartbeat=5.0, name=None):
+        self.host = host
+        self.port = port
+        self.heartbeat = heartbeat
+        self.name = name if name != None else "{}:{}".format(socket.gethostname(), os.getpid())
+        self.lock = threading.Lock()
+        self.sock = None
+        self.file = None
+        self.busy = threading.Event()
+        self.stopped = threading.Event()
+
+    def request(self, message):
+        message['worker'] = self.name
+        with self.lock:
+            self.file.write((json.dumps(message) + '\n').encode('utf-8'))
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise ConnectionError("Coordinator closed the connection")
+        return json.loads(line.decode('utf-8'))
+
+    def beat(self):
+        while not self.stopped.wait(self.heartbeat):
+            if self.busy.is_set():
+                try:
+                    self.request(dict(op='heartbeat'))
+                except (OSError, ValueError):
+                    return
+
+    def run(self):
+        """
+        Work until the coordinator says everything is done. Returns the number of scenarios run.
+        """
+        self.sock = socket.create_connection((self.host, self.port))
+        self.file = self.sock.makefile('rwb')
+        beater = threading.Thread(target=self.beat)
+        beater.daemon = True
+        beater.start()
+        count = 0
+        try:
+            while True:
+                reply = self.request(dict(op='pull'))
+                if reply.get('done'):
+                    break
+                if 'wait' in reply:
+                    time.sleep(reply['wait'])
+                    continue
+                self.busy.set()
+                results = list()
+                for d in reply['scenarios']:
+                    result = _run_safe(Scenario.from_dict(d))
+                    result['worker'] = self.name
+                    results.append(result)
+                self.busy.clear()
+                self.request(dict(op='result', batch=reply['batch'], results=results))
+                count += len(results)
+        finally:
+            self.stopped.set()
+            self.file.close()
+            self.sock.close()
+        return count
+
+
+def main():
+    """
+    python cluster.py coordinator [--host=addr] [--port=port] [--batch=N] [--lease=seconds] [--metrics-file=filename]
+        [--results=filename]
+    python cluster.py worker [--host=addr] [--port=port]
+    """
+    if len(sys.argv) < 2 or sys.argv[1] not in ('coordinator', 'worker'):
+        print(main.__doc__)
+        return
+    options = sys.argv[2:]
+    host = get_option(options, '--host', '127.0.0.1')
+    port = int(get_option(options, '--port', 9436))
+    if sys.argv[1] == 'worker':
+        count = Worker(host, port).run()
+        print("Worker ran {} scenarios".format(count))
+        return
+
+    scenarios = grid_scenarios(range(20, 60, 5), range(-10, -2), paths=[("ped", "test_path.txt")])
+    coordinator = Coordinator(scenarios, batch_size=int(get_option(options, '--batch', 8)),
+        lease=float(get_option(options, '--lease', 30)), host=host, port=port,
+        results_file=get_option(options, '--results')).start()
+    writer = None
+    if get_option(options, '--metrics-file') != None:
+        writer = MetricsFileWriter(coordinator.metrics, get_option(options, '--metrics-file')).start()
+    print("Coordinator listening on {}:{}".format(coordinator.host, coordinator.port))
+    results = coordinator.wait()
+    # Give the workers a moment to hear that we are done.
+    time.sleep(2)
+    coordinator.stop()
+    if writer != None:
+        writer.stop()
+    impacts = len([r for r in results.values() if r.get('impact')])
+    failed = len([r for r in results.values() if 'error' in r])
+    print("Collected {} scenarios: {} impacts, {} failed, {} batches re-queued".format(len(results),
+        impacts, failed, coordinator.requeued))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,23 +5,34 @@
 #
 #######################################################
 
+import os
 import plotly
 import plotly.graph_objs as go
 
 
 class LineGraph(object):
 
-	def __init__(self, rate, ped_info, car_info, time, acceleration, distance):
-		self.time = time
+	def __init__(self, rate, ped_info, car_info, time, acceleration, distance, rate_time,
+			out_dir=None, auto_open=True):
+		"""
+		\param time: simulated time in ms of each recorded entry (see Simulation.record_times)
+		\param rate_time: simulated time in ms of each approach rate, one per sensor packet
+		\param out_dir: directory to write the html files to (current directory if None)
+		\param auto_open: open every graph in the default browser
+		"""
+		self.time = list(time)
+		self.rate_time = list(rate_time)
 		self.car_info = car_info
 		self.ped_info = ped_info
 		self.ped_pos = list()
 		self.car_pos = list()
 		self.ped_speed = list()
 		self.car_speed = list()
-		self.rates = rate
+		self.rates = list(rate)
 		self.acceleration = [i*1000 for i in acceleration]
-		self.distance = distance
+		self.distance = list(distance)
+		self.out_dir = out_dir
+		self.auto_open = auto_open
 		self.get_info()
 		self.display()
 
@@ -33,6 +44,16 @@ class LineGraph(object):
 			self.ped_pos.append((info[0].x, info[0].y))
 			self.ped_speed.append(info[1])
 
+	def write(self, fig, filename):
+		"""
+		Write a figure to an html file.
+		"""
+		if self.out_dir != None:
+			if not os.path.isdir(self.out_dir):
+				os.makedirs(self.out_dir)
+			filename = os.path.join(self.out_dir, filename)
+		plotly.offline.plot(fig, filename=filename, auto_open=self.auto_open)
+
 	def display(self):
 		"""
 		Display the info in graphs.
@@ -44,7 +65,7 @@ class LineGraph(object):
 		self.make_acceleration_graph()
 
 	def make_acceleration_graph(self):
-		time = [i for i in range(self.time)]
+		time = self.time
 			
 		trace0 = go.Scatter(
 			x = time,
@@ -58,18 +79,16 @@ class LineGraph(object):
 		data = [trace0]
 
 		layout = dict(title = 'Magnitude of Acceleration vs Time of the Car',
-			xaxis = dict(title = 'Time (s * 10)'),
+			xaxis = dict(title = 'Time (ms)'),
 			yaxis = dict(title = '|Acceleration| (m/s^2)'),
 			)
 
 		fig = dict(data=data, layout=layout)
-		plotly.offline.plot(fig, filename='acceleration-graph.html')
+		self.write(fig, 'acceleration-graph.html')
 
 	def make_rate_graph(self):
-		time = [i for i in range(self.time)]
-			
 		trace0 = go.Scatter(
-			x = time,
+			x = self.rate_time,
 			y = self.rates,
 			name = 'Rate of Approach',
 			line = dict(
@@ -80,18 +99,18 @@ class LineGraph(object):
 		data = [trace0]
 
 		layout = dict(title = 'Rate at which the car approaches the pedestrian',
-			xaxis = dict(title = 'Time (s * 10)'),
+			xaxis = dict(title = 'Time (ms)'),
 			yaxis = dict(title = 'Rate (m/s)'),
 			)
 
 		fig = dict(data=data, layout=layout)
-		plotly.offline.plot(fig, filename='rate-graph.html')
+		self.write(fig, 'rate-graph.html')
 
 	def make_speed_graph(self):
 		"""
 		Speed graph.
 		"""
-		time = [i for i in range(self.time)]
+		time = self.time
 			
 		trace0 = go.Scatter(
 			x = time,
@@ -119,13 +138,13 @@ class LineGraph(object):
 			)
 
 		fig = dict(data=data, layout=layout)
-		plotly.offline.plot(fig, filename='speed-graph.html')
+		self.write(fig, 'speed-graph.html')
 
 	def make_dist_to_ped_graph(self):
 		"""
 		The distance between the car and the ped over time.
 		"""
-		time = [i for i in range(self.time)]
+		time = self.time
 
 		trace0 = go.Scatter(
 			x = time,
@@ -144,13 +163,13 @@ class LineGraph(object):
 			)
 
 		fig = dict(data=data, layout=layout)
-		plotly.offline.plot(fig, filename='distance-graph.html')
+		self.write(fig, 'distance-graph.html')
 
 	def make_pos_graph(self):
 		"""
 		Positional graph.
 		"""
-		time = [i for i in range(self.time)]
+		time = self.time
 
 		car_x = [i[0] for i in self.car_pos]
 		car_y = [i[1] for i in self.car_pos]
@@ -184,7 +203,7 @@ class LineGraph(object):
 			)
 
 		fig = dict(data=data, layout=layout)
-		plotly.offline.plot(fig, filename='x-positional-graph.html')
+		self.write(fig, 'x-positional-graph.html')
 
 		trace0 = go.Scatter(
 			x = time,
@@ -212,4 +231,132 @@ class LineGraph(object):
 			)
 
 		fig = dict(data=data, layout=layout)
-		plotly.offline.plot(fig, filename='y-positional-graph.html')
\ No newline at end of file
+		self.write(fig, 'y-positional-graph.html')
+
+
+def downsample(values, points=500):
+	"""
+	Every n-th value so that at most 'points' remain (the last value is always kept).
+	"""
+	values = list(values)
+	if len(values) <= points:
+		return values
+	step = len(values)/float(points - 1)
+	return [values[int(i*step)] for i in range(points - 1)] + [values[-1]]
+
+
+def render_run(job):
+	"""
+	Write the graphs for one run without opening a browser, see sweep.run_scenario.
+	\param job: (out_dir, rate, ped_info, car_info, time, acceleration, distance, rate_time)
+	"""
+	out_dir = job[0]
+	LineGraph(*job[1:], out_dir=out_dir, auto_open=False)
+	return out_dir
+
+
+class OverlayGraph(object):
+	"""
+	Trajectories of many runs in one figure.
+	"""
+
+	colors = ['rgb(0, 20, 200)', 'rgb(0, 200, 5)', 'rgb(200, 20, 0)', 'rgb(150, 0, 150)',
+		'rgb(230, 140, 0)', 'rgb(0, 160, 160)', 'rgb(90, 90, 90)']
+
+	def __init__(self, runs, filename='overlay-graph.html', auto_open=False):
+		"""
+		\param runs: list of (name, car positions, ped positions) with positions as (x, y)
+		"""
+		self.runs = runs
+		self.filename = filename
+		self.auto_open = auto_open
+		self.make_overlay_graph()
+
+	def make_overlay_graph(self):
+		data = list()
+		for i, run in enumerate(self.runs):
+			name, car_pos, ped_pos = run
+			color = self.colors[i % len(self.colors)]
+			data.append(go.Scatter(
+				x = [p[0] for p in car_pos],
+				y = [p[1] for p in car_pos],
+				name = '{} car'.format(name),
+				legendgroup = name,
+				line = dict(
+					color = (color),
+					width = 2)
+			))
+			data.append(go.Scatter(
+				x = [p[0] for p in ped_pos],
+				y = [p[1] for p in ped_pos],
+				name = '{} pedestrian'.format(name),
+				legendgroup = name,
+				line = dict(
+					color = (color),
+					width = 2,
+					dash = 'dot')
+			))
+
+		layout = dict(title = 'Car and Pedestrian Trajectories for {} Runs'.format(len(self.runs)),
+			xaxis = dict(title = 'X Coordinates'),
+			yaxis = dict(title = 'Y Coordinates'),
+			)
+
+		fig = dict(data=data, layout=layout)
+		dirname = os.path.dirname(self.filename)
+		if dirname != '' and not os.path.isdir(dirname):
+			os.makedirs(dirname)
+		plotly.offline.plot(fig, filename=self.filename, auto_open=self.auto_open)
+
+
+class BoundaryGraph(object):
+	"""
+	Heatmap of the impact fraction with the safe/impact boundary on top.
+	"""
+
+	def __init__(self, bmap, filename='boundary-graph.html', auto_open=False):
+		"""
+		\param bmap: a finished boundary.BoundaryMap
+		"""
+		self.bmap = bmap
+		self.filename = filename
+		self.auto_open = auto_open
+		self.make_boundary_graph()
+
+	def make_boundary_graph(self):
+		bmap = self.bmap
+		n = bmap.resolution
+		# cell centers along each axis
+		xs = [bmap.point(i + .5, 0)[0] for i in range(n)]
+		ys = [bmap.point(0, j + .5)[1] for j in range(n)]
+
+		trace0 = go.Heatmap(
+			x = xs,
+			y = ys,
+			z = bmap.heatmap(),
+			zmin = 0,
+			zmax = 1,
+			colorscale = [[0, 'rgb(0, 200, 5)'], [1, 'rgb(200, 20, 0)']],
+			colorbar = dict(title = 'Impact')
+		)
+
+		data = [trace0]
+		for i, line in enumerate(bmap.polylines()):
+			data.append(go.Scatter(
+				x = [p[0] for p in line],
+				y = [p[1] for p in line],
+				name = 'Boundary',
+				showlegend = i == 0,
+				mode = 'lines',
+				line = dict(
+					color = ('rgb(0, 0, 0)'),
+					width = 2)
+			))
+
+		layout = dict(title = 'Safe Passage vs Impact ({} runs)'.format(bmap.runs),
+			xaxis = dict(title = bmap.x_axis),
+			yaxis = dict(title = bmap.y_axis),
+			)
+
+		fig = dict(data=data, layout=layout)
+		plotly.offline.plot(fig, filename=self.filename, auto_open=self.auto_open)
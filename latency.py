@@ -0,0 +1,139 @@
+#######################################################
+#
+# Controller decision latency measurement.
+#
+#######################################################
+
+import time
+
+
+class LatencyHistogram(object):
+    """
+    HDR style histogram of nanosecond values. Values below 2^precision are
+    counted exactly, above that every power of two is split into 2^(precision - 1)
+    linear buckets, so any value is off by less than 1/2^(precision - 1).
+    """
+    def __init__(self, precision=7):
+        self.precision = precision
+        self.sub_count = 1 << precision
+        self.half = self.sub_count >> 1
+        self.counts = dict() # bucket index -> count
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, value):
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.precision
+        return shift*self.half + (value >> shift)
+
+    def highest(self, index):
+        """
+        Largest value that falls in bucket 'index'.
+        """
+        if index < self.sub_count:
+            return index
+        shift = index//self.half - 1
+        sub = index - shift*self.half
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(int(value), 0)
+        i = self.index(value)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min == None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, n in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + n
+        self.count += other.count
+        self.total += other.total
+        if other.min != None and (self.min == None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """
+        Value at percentile 'p' (0-100), reported as the top of its bucket.
+        """
+        if self.count == 0:
+            return 0
+        target = max(int(round(p/100.0*self.count)), 1)
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= target:
+                return min(self.highest(i), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total/float(self.count) if self.count > 0 else 0
+
+    def summary(self):
+        """
+        The distribution in microseconds.
+        """
+        us = 1000.0
+        return dict(count=self.count, mean_us=self.mean()/us, p50_us=self.percentile(50)/us,
+            p90_us=self.percentile(90)/us, p99_us=self.percentile(99)/us, max_us=self.max/us)
+
+
+class LatencyBudgetExceeded(Exception):
+    """
+    Error raised when the controller is slower than its budget.
+    """
+    def __init__(self, violations):
+        super(LatencyBudgetExceeded, self).__init__("Latency budget exceeded: {}".format("; ".join(violations)))
+        self.violations = violations
+
+
+class LatencyMonitor(object):
+    """
+    Times the controller calls and checks them against a budget.
+    """
+    def __init__(self, p99_ms=None, max_ms=100.0, fail=False):
+        """
+        \param p99_ms: budget for the 99th percentile of each call (None for no budget)
+        \param max_ms: budget for the slowest call, 100 ms is the sensor packet interval
+        \param fail: raise LatencyBudgetExceeded at the end of the run instead of just flagging it
+        """
+        self.p99_ms = p99_ms
+        self.max_ms = max_ms
+        self.fail = fail
+        self.histograms = dict()
+
+    def call(self, name, fn, *args):
+        """
+        Call fn(*args) and record how long it took under 'name'.
+        """
+        start = time.perf_counter_ns()
+        result = fn(*args)
+        elapsed = time.perf_counter_ns() - start
+        if name not in self.histograms:
+            self.histograms[name] = LatencyHistogram()
+        self.histograms[name].record(elapsed)
+        return result
+
+    def violations(self):
+        """
+        Descriptions of every budget that was exceeded.
+        """
+        violations = list()
+        for name, hist in sorted(self.histograms.items()):
+            p99 = hist.percentile(99)/1e6
+            worst = hist.max/1e6
+            if self.p99_ms != None and p99 > self.p99_ms:
+                violations.append("{} p99 {:.3f} ms > {} ms".format(name, p99, self.p99_ms))
+            if self.max_ms != None and worst > self.max_ms:
+                violations.append("{} max {:.3f} ms > {} ms".format(name, worst, self.max_ms))
+        return violations
+
+    def summary(self):
+        return dict((name, hist.summary()) for name, hist in self.histograms.items())
@@ -0,0 +1,168 @@
+#######################################################
+#
+# Live progress metrics for long running sweeps.
+#
+#######################################################
+
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class SweepMetrics(object):
+    """
+    Counters describing the progress of a sweep.
+    Updated once per scenario so the cost is independent of the tick count.
+    """
+    def __init__(self, total=0):
+        self.lock = threading.Lock()
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.impacts = 0
+        self.worker_ticks = dict() # worker -> simulated ticks
+        self.worker_busy = dict() # worker -> wall clock seconds spent simulating
+        self.start = time.time()
+
+    def add_scenarios(self, count):
+        """
+        Note that 'count' more scenarios were queued.
+        """
+        with self.lock:
+            self.total += count
+
+    def scenario_done(self, worker, ticks, elapsed, impact=False):
+        """
+        Record a finished scenario.
+        \param worker: identifier of the process that ran it
+        \param ticks: number of simulated ticks
+        \param elapsed: wall clock seconds the run took
+        """
+        with self.lock:
+            self.completed += 1
+            if impact:
+                self.impacts += 1
+            self.worker_ticks[worker] = self.worker_ticks.get(worker, 0) + ticks
+            self.worker_busy[worker] = self.worker_busy.get(worker, 0) + elapsed
+
+    def scenario_failed(self, worker=None):
+        """
+        Record a scenario that raised instead of finishing.
+        """
+        with self.lock:
+            self.failed += 1
+
+    def queue_depth(self):
+        """
+        Scenarios queued or in flight.
+        """
+        return max(self.total - self.completed - self.failed, 0)
+
+    def eta(self):
+        """
+        Estimated seconds until the sweep is done, None until something finished.
+        """
+        done = self.completed + self.failed
+        if done == 0:
+            return None
+        rate = done/max(time.time() - self.start, 1e-9)
+        return self.queue_depth()/rate
+
+    def render(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            lines = list()
+            lines.append("# HELP pedac_scenarios_completed_total Scenarios that finished running.")
+            lines.append("# TYPE pedac_scenarios_completed_total counter")
+            lines.append("pedac_scenarios_completed_total {}".format(self.completed))
+            lines.append("# HELP pedac_scenarios_failed_total Scenarios that raised an error.")
+            lines.append("# TYPE pedac_scenarios_failed_total counter")
+            lines.append("pedac_scenarios_failed_total {}".format(self.failed))
+            lines.append("# HELP pedac_impacts_total Scenarios where the car hit the pedestrian.")
+            lines.append("# TYPE pedac_impacts_total counter")
+            lines.append("pedac_impacts_total {}".format(self.impacts))
+            lines.append("# HELP pedac_queue_depth Scenarios queued or in flight.")
+            lines.append("# TYPE pedac_queue_depth gauge")
+            lines.append("pedac_queue_depth {}".format(self.queue_depth()))
+            lines.append("# HELP pedac_worker_ticks_per_second Simulated ticks per second of busy time.")
+            lines.append("# TYPE pedac_worker_ticks_per_second gauge")
+            for worker in sorted(self.worker_ticks, key=str):
+                busy = self.worker_busy[worker]
+                rate = self.worker_ticks[worker]/busy if busy > 0 else 0
+                lines.append('pedac_worker_ticks_per_second{{worker="{}"}} {:.1f}'.format(worker, rate))
+            eta = self.eta()
+            lines.append("# HELP pedac_eta_seconds Estimated seconds until the sweep is done.")
+            lines.append("# TYPE pedac_eta_seconds gauge")
+            lines.append("pedac_eta_seconds {}".format("NaN" if eta == None else "{:.1f}".format(eta)))
+        return "\n".join(lines) + "\n"
+
+
+class MetricsFileWriter(object):
+    """
+    Periodically write the metrics to a file (e.g. for the node exporter textfile collector).
+    """
+    def __init__(self, metrics, filename, interval=5.0):
+        self.metrics = metrics
+        self.filename = filename
+        self.interval = interval
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.loop, name="metrics-writer")
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def write(self):
+        """
+        Write the file atomically so a scraper never sees half of it.
+        """
+        tmp = self.filename + ".tmp"
+        with open(tmp, 'w') as out:
+            out.write(self.metrics.render())
+        os.replace(tmp, self.filename)
+
+    def loop(self):
+        while not self.done.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+        self.write()
+
+
+class MetricsServer(object):
+    """
+    Serve the metrics over http on localhost.
+    """
+    def __init__(self, metrics, port=9435, host='127.0.0.1'):
+        metrics_ref = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics_ref.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server")
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
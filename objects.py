@@ -8,6 +8,10 @@
 
 import math
 
+# Integrators for time steps longer than 1 ms, see SpaceObject.advance().
+EULER = 'euler'
+EXACT = 'exact'
+
 class SpaceObject(object):
     """
     Space object abstract base class.
@@ -23,6 +27,8 @@ class SpaceObject(object):
         self.acceleration = Velocity()
         self.path = None
         self.time = 0 # Time in ms
+        self.dt = 1 # Time step in ms
+        self.integrator = EXACT
 
     def get_dist(self, space_object):
         """
@@ -57,8 +63,18 @@ class SpaceObject(object):
 
     def move(self):
         """
-        Move this space object by the velocity. Called every millisecond.
+        Move this space object by the velocity. Called every time step (self.dt ms).
+        """
+        self.move_for(self.dt)
+
+    def move_for(self, n):
+        """
+        Move for 'n' ms starting at self.time.
         """
+        if n != 1:
+            self.move_steps(n)
+            return
+
         if self.path != None:
             for transition in self.path.path:
                 if transition.time == self.time:
@@ -72,6 +88,81 @@ class SpaceObject(object):
         pos = Pos(self.velocity.dx, self.velocity.dy, self.velocity.dz)
         self.pos += pos
 
+    def move_steps(self, n):
+        """
+        Move for 'n' ms at once. Path transitions inside them split the move,
+        so they happen at the same ms as with 1 ms steps.
+        """
+        start = self.time
+        done = 0
+        if self.path != None:
+            # Like move_for(1), only whole ms can match a transition. Same time keeps the file order.
+            changes = [t for t in self.path.path if start <= t.time < start + n and t.time == int(t.time)]
+            for transition in sorted(changes, key=lambda t: t.time):
+                self.advance(int(transition.time) - start - done)
+                done = int(transition.time) - start
+                self.velocity = transition.velocity()
+                self.acceleration = transition.acceleration()
+        self.advance(n - done)
+
+    def advance(self, n):
+        """
+        Move for 'n' ms with a constant acceleration.
+        EULER: one semi-implicit Euler step of n ms (the 1 ms move() scaled up).
+        EXACT: the n 1 ms steps of move() in closed form, including the ms the speed cap is hit.
+        """
+        if n <= 0:
+            return
+        v = self.velocity
+        a = self.acceleration
+        s = self.steady_state_velocity
+        if self.integrator == EULER:
+            v = v + n*a
+            if v > s:
+                v = s
+                self.acceleration = Velocity()
+            self.velocity = v
+            self.pos += Pos(v.dx*n, v.dy*n, v.dz*n)
+            return
+
+        capped = self.cap_step(n)
+        m = n if capped == None else capped - 1
+        # After k steps the velocity is v + k*a, so the steps add m*v + a*m*(m + 1)/2.
+        c = m*(m + 1)/2.0
+        pos = Pos(v.dx*m + a.dx*c, v.dy*m + a.dy*c, v.dz*m + a.dz*c)
+        v = v + m*a
+        if capped != None:
+            # From the capped step on it moves at the steady state velocity.
+            v = s
+            self.acceleration = Velocity()
+            rest = n - m
+            pos += Pos(s.dx*rest, s.dy*rest, s.dz*rest)
+        self.velocity = v
+        self.pos += pos
+
+    def cap_step(self, n):
+        """
+        First of the next n 1 ms steps (1..n) after which the speed is over the steady state speed, None if none.
+        """
+        v = self.velocity
+        a = self.acceleration
+        if v + a > self.steady_state_velocity:
+            return 1
+        # |v + k*a|^2 - |s|^2 is a parabola in k, it is not positive at k = 1 so it
+        # goes over the cap after its larger root.
+        A = a.dx**2 + a.dy**2 + a.dz**2
+        if A == 0:
+            return None
+        B = 2*(v.dx*a.dx + v.dy*a.dy + v.dz*a.dz)
+        C = v.dx**2 + v.dy**2 + v.dz**2 - self.steady_state_velocity.speed()**2
+        over = lambda k: A*k*k + B*k + C > 0
+        k = max(int(math.floor((-B + math.sqrt(max(B*B - 4*A*C, 0)))/(2*A))) + 1, 2)
+        while k > 2 and over(k - 1):
+            k -= 1
+        while not over(k):
+            k += 1
+        return k if k <= n else None
+
     def area(self):
         """
         Abstract method to cover a specific area?
@@ -18,5 +18,38 @@ class Pedestrian(SpaceObject):
         return "Name: {}, Pos: {}, Vel: {}, Dead: {}".format(self.name, self.pos, self.velocity*1000.0, self.impact)
 
     def tick(self):
-        self.move()
-        self.time += 1
\ No newline at end of file
+        # Finish the time step, lead() may have done all but its last ms.
+        ms = self.dt - self.time % self.dt
+        self.move_for(ms)
+        self.time += ms
+
+    def lead(self):
+        """
+        Move all but the last ms of a time step longer than 1 ms, before the car looks at the
+        pedestrian. Then the car sees it one ms behind itself, as it does with 1 ms steps.
+        """
+        self.move_for(self.dt - 1)
+        self.time += self.dt - 1
+
+class ReplayPedestrian(Pedestrian):
+    """
+    Pedestrian that replays a precomputed trajectory.PedestrianTrajectory instead of
+    moving itself. Past the end of the trajectory it moves on its own as usual.
+    The trajectory has every ms, so with longer time steps it still follows the 1 ms reference.
+    """
+    def __init__(self, sim, name, radius, trajectory):
+        self.trajectory = trajectory
+        pos, velocity = trajectory.row(0)
+        super(ReplayPedestrian, self).__init__(sim, name, radius, pos, velocity)
+        self.path = trajectory.path
+        self.replaying = True
+
+    def move_for(self, n):
+        if self.time + n < len(self.trajectory):
+            self.pos, self.velocity = self.trajectory.row(self.time + n)
+            return
+        if self.replaying:
+            # Only needed to move on its own, so it is only read when the replay ends.
+            self.acceleration = self.trajectory.acceleration(self.time)
+            self.replaying = False
+        super(ReplayPedestrian, self).move_for(n)
@@ -6,17 +6,53 @@
 #######################################################
 
 import sys
+import math
 import time
+import functools
+from collections import namedtuple
 import os.path as path
 from ped import *
 from car import *
 from graphs import *
+from recorder import Recorder
+from scheduler import Scheduler
+from results import SimulationResult
+from latency import LatencyMonitor, LatencyBudgetExceeded
+
+# (period, phase) in ms of the work that doesn't have to happen every tick.
+# A task fires at the end of ms 'phase' and then every 'period' ms after it.
+# With 1 ms time steps these are ticks, see tick_rate() for longer ones.
+DEFAULT_RATES = dict(
+    sensor=(100, 99), # sensor packets and the controller
+    efficiency=(1, 0), # efficiency bookkeeping
+    recorder=(1, 0), # recording the tracks and graphs
+    impact=(1, 0), # impact check
+    safe=(1, 0), # safe passage check
+    ghost=(1, 0), # efficiency ghost car
+)
+
+# State of the simulation after a tick, see Simulation.iter_ticks().
+# Positions in m, speeds in m/s, distance is None until the sensor has seen the pedestrian.
+TickState = namedtuple('TickState', ['tick', 'time', 'car_x', 'car_y', 'car_speed', 'ped_x', 'ped_y',
+    'ped_speed', 'distance', 'braking', 'packet', 'impact'])
 
 class Simulation(object):
     """
     Simulation Object
     """
-    def __init__(self, name, options=list(), time_out=1000000):
+    def __init__(self, name, options=list(), time_out=1000000, recorder=None, rates=None, latency=None,
+            dt=None, integrator=None):
+        """
+        \param recorder: a recorder.Recorder to spill the recorded data to disk with,
+            otherwise everything is kept in memory.
+        \param rates: dict overriding DEFAULT_RATES. Values are (period, phase) or just
+            a period, in which case the task fires at the end of every period.
+        \param latency: a latency.LatencyMonitor to time the controller with. The options
+            '--latency-budget=ms' (p99), '--latency-max=ms' and '--latency-fail' make one.
+        \param dt: time step in whole ms (option '--dt=ms'), 1 by default. It has to divide the
+            rates, so 1, 2, 4, 5, 10, 20, 25, 50 or 100 with the default sensor period.
+        \param integrator: objects.EXACT or objects.EULER (option '--integrator=name') for steps over 1 ms
+        """
         self.name = name
         self.simulated = False
         self.car = None
@@ -27,9 +63,42 @@ class Simulation(object):
         self.abort = False
         self.total_time = None
         self.options = [i.lower() for i in options]
+        self.raw_options = list(options) # for options with paths, which keep their case
+        self.quiet = '--quiet' in self.options
         self.approach_rate_graph = list()
+        self.approach_rate_time = list() # ms of each approach rate
         self.efficiency = 0
+        self.result = None
+        self.recording = True
+        self.ghost = None
         self.paths = list()
+        self.rates = dict(DEFAULT_RATES)
+        if rates != None:
+            for task, rate in rates.items():
+                if task not in DEFAULT_RATES:
+                    raise ValueError("Unknown task '{}' in rates".format(task))
+                if isinstance(rate, int):
+                    rate = (rate, rate - 1)
+                self.rates[task] = tuple(rate)
+        self.dt = int(dt if dt != None else get_option(self.options, '--dt', 1))
+        if self.dt < 1:
+            raise ValueError("The time step has to be at least 1 ms")
+        self.integrator = integrator if integrator != None else get_option(self.options, '--integrator', EXACT)
+        if self.integrator not in (EXACT, EULER):
+            raise ValueError("Unknown integrator '{}'".format(self.integrator))
+        self.tick_rates = dict((task, tick_rate(rate, self.dt)) for task, rate in self.rates.items())
+        self.time_out_ticks = int(math.ceil(time_out/float(self.dt)))
+        self.scheduler = None
+        self.latency = latency
+        if latency == None and get_option(self.options, '--latency-budget') != None:
+            self.latency = LatencyMonitor(float(get_option(self.options, '--latency-budget')),
+                float(get_option(self.options, '--latency-max', 100)), '--latency-fail' in self.options)
+        self.recorder = recorder
+        if recorder != None:
+            self.track_car = recorder.track('track_car')
+            self.track_ped = recorder.track('track_ped')
+            self.approach_rate_graph = recorder.values('approach_rate')
+            self.approach_rate_time = recorder.values('approach_rate_time')
 
     def add_car(self, name, x, y, dx, dy, z=0, dz=0, width=2, depth=2):
         """
@@ -41,6 +110,11 @@ class Simulation(object):
         p = Pos(x, y, z)
         v = Velocity(dx/1000.0, dy/1000.0, dz/1000.0)
         self.car = Car(self, name, width, depth, p, v)
+        self.car.controller.monitor = self.latency
+        if self.recorder != None:
+            self.car.acceleration_graph = self.recorder.values('acceleration')
+            self.car.distance_to_ped_graph = self.recorder.values('distance_to_ped')
+            self.car.brake_graph = self.recorder.values('brake')
 
     def add_pedestrian(self, name, x, y, dx, dy, z=0, dz=0, radius=.5):
         """
@@ -53,6 +127,14 @@ class Simulation(object):
         v = Velocity(dx/1000.0, dy/1000.0, dz/1000.0)
         self.pedestrian = Pedestrian(self, name, radius, p, v)
 
+    def add_replay_pedestrian(self, name, trajectory, radius=.5):
+        """
+        Define a pedestrian that replays a precomputed trajectory (trajectory.PedestrianTrajectory)
+        instead of being stepped every tick. Its start comes from the trajectory.
+        \param: radius given in m
+        """
+        self.pedestrian = ReplayPedestrian(self, name, radius, trajectory)
+
     def add_path(self, name, file):
         """
         Add path of velocities to Space Object with name 'name'.
@@ -96,6 +178,8 @@ class Simulation(object):
         """
         The header at the start of the run.
         """
+        if self.quiet:
+            return
         string = "\nStarting simulation of system.\nInitial Values:\n{}\n{}\n\n".format(
             self.car, self.pedestrian)
         print(string)
@@ -135,34 +219,147 @@ class Simulation(object):
             elif path.name == self.pedestrian.name:
                 self.pedestrian.path = path
 
-    def run(self):
+    def record_car(self):
+        car_speed = round(self.car.velocity.speed()*1000, 2)
+        self.track_car.append((self.car.pos, car_speed))
+
+    def record_ped(self):
+        ped_speed = round(self.pedestrian.velocity.speed()*1000, 2)
+        self.track_ped.append((self.pedestrian.pos, ped_speed))
+
+    def record_times(self):
         """
-        Run this simulation.
+        Simulated time in ms of each recorded entry, taken at the end of its tick.
+        """
+        period, phase = self.tick_rates['recorder']
+        return [(phase + k*period + 1)*self.dt for k in range(len(self.track_car))]
+
+    def schedule(self, ghost, record=True):
+        """
+        Register everything that happens during a tick with a new scheduler.
+        Moving the car and the pedestrian happens every tick, the rest at self.tick_rates.
+        \param record: register the recorders
+        """
+        scheduler = Scheduler()
+        if self.dt > 1:
+            scheduler.add('pedestrian_lead', self.pedestrian.lead, order=5)
+        scheduler.add('car', self.car.tick, order=10)
+        self.car.schedule(scheduler, self.tick_rates, record)
+        period, phase = self.tick_rates['ghost']
+        scheduler.add('ghost', functools.partial(ghost.tick, period), period, phase, order=70)
+        if record:
+            scheduler.add('car_track', self.record_car, *self.tick_rates['recorder'], order=80)
+        scheduler.add('pedestrian', self.pedestrian.tick, order=90)
+        if record:
+            scheduler.add('ped_track', self.record_ped, *self.tick_rates['recorder'], order=100)
+        return scheduler
+
+    def setup(self, record=True):
+        """
+        Get ready to run, False if the simulation is not valid.
         """
         # Validate the simulation.
         if not self.validate():
-            return
+            return False
         # Associate paths...
         self.map_paths()
         # Make the efficiency ghost car..
-        ghost = EfficiencyGhostCar(self.car)
+        self.ghost = EfficiencyGhostCar(self.car)
+        for obj in (self.car, self.pedestrian, self.ghost):
+            obj.dt = self.dt
+            obj.integrator = self.integrator
+        self.recording = record
+        self.scheduler = self.schedule(self.ghost, record)
         self.display_run_header()
+        return True
+
+    def run(self):
+        """
+        Run this simulation.
+        \return SimulationResult, None if the simulation is not valid.
+        """
+        if not self.setup():
+            return
         count = 0
         while(not self.abort):
-            self.car.tick()
-            ghost.tick() # Establish efficiency as unchanging vel..
-            car_speed = round(self.car.velocity.speed()*1000, 2)
-            self.track_car.append((self.car.pos, car_speed))
-            self.pedestrian.tick()
-            ped_speed = round(self.pedestrian.velocity.speed()*1000, 2)
-            self.track_ped.append((self.pedestrian.pos, ped_speed))
-            if count >= self.time_out_value:
+            self.scheduler.run(count)
+            if count >= self.time_out_ticks:
                 self.stop()
             count += 1
+        return self.finish(count)
+
+    def iter_ticks(self, stride=1, packets_only=False, where=None, record=False):
+        """
+        Run this simulation one tick at a time, yielding a TickState after the ticks asked for.
+        Nothing is recorded unless 'record' is set, so a consumer can keep just what it needs
+        or stop early (leaving the simulation unfinished, a recorder is still closed). When the
+        simulation runs to the end its result is in self.result, without the recorded metrics
+        if nothing was recorded.
+        \param stride: only every 'stride'-th tick
+        \param packets_only: only ticks where the car got a sensor packet
+        \param where: only states for which where(state) is true
+        """
+        if not self.setup(record):
+            return
+        car = self.car
+        ped = self.pedestrian
+        count = 0
+        finished = False
+        try:
+            while(not self.abort):
+                self.scheduler.run(count)
+                if count >= self.time_out_ticks:
+                    self.stop()
+                if count % stride == 0 and (not packets_only or car.packet_time == car.time):
+                    state = TickState(count, car.time, car.pos.x, car.pos.y, car.velocity.speed()*1000,
+                        ped.pos.x, ped.pos.y, ped.velocity.speed()*1000, car.sensor.get_distance(),
+                        car.break_on, car.packet_time == car.time, car.impact)
+                    if where == None or where(state):
+                        yield state
+                count += 1
+            finished = True
+        finally:
+            if not finished and self.recorder != None:
+                # Stopped early, write out what was recorded so far.
+                self.recorder.close(dict(name=self.name, total_time=car.time, finished=False))
+        self.finish(count)
+
+    def finish(self, count):
+        """
+        Work out the results after running 'count' ticks.
+        """
         self.simulated = True
-        self.total_time = count
+        self.total_time = count*self.dt
+        ghost = self.ghost
         denom = ghost.get_efficiency_baseline()
-        self.efficiency = ((ghost.distance/(self.car.efficiency_time/1000.0))/denom)*100.0
+        if denom == 0:
+            # The pedestrian was never seen so the car drove exactly like the ghost.
+            self.efficiency = 100.0
+        else:
+            self.efficiency = ((ghost.distance/(self.car.efficiency_time/1000.0))/denom)*100.0
+        if self.recorder != None:
+            self.recorder.close(dict(name=self.name, impact=self.car.impact or self.pedestrian.impact,
+                efficiency=self.efficiency, total_time=self.total_time))
+        self.result = SimulationResult.from_simulation(self)
+        self.check_latency()
+        return self.result
+
+    def check_latency(self):
+        """
+        Compare the controller timings with the latency budget.
+        """
+        if self.latency == None:
+            return
+        self.result.latency = self.latency.summary()
+        violations = self.latency.violations()
+        self.result.latency_ok = len(violations) == 0
+        if len(violations) == 0:
+            return
+        if self.latency.fail:
+            raise LatencyBudgetExceeded(violations)
+        if not self.quiet:
+            for violation in violations:
+                print("Warning: latency budget exceeded -- {}".format(violation))
 
     def view_results(self):
         if not self.has_been_simulated():
@@ -179,9 +376,15 @@ class Simulation(object):
         print("Total simulated time: {} seconds".format(self.total_time/1000.0))
         print("\nEfficiency calculated by comparing simulated algorithm to an ideal 'ghost' car path with no pedestrian.")
         print("Efficiency calculation: {:.2f} %".format(self.efficiency))
-        if '--graph' in self.options:
-            LineGraph(self.approach_rate_graph, self.track_ped, self.track_car, self.total_time,
-                self.car.acceleration_graph, self.car.distance_to_ped_graph)
+        if self.latency != None:
+            for name, stats in sorted(self.latency.summary().items()):
+                print("Controller {} latency: p50 {:.1f} us, p99 {:.1f} us, max {:.1f} us ({} calls)".format(
+                    name, stats['p50_us'], stats['p99_us'], stats['max_us'], stats['count']))
+        graph_dir = get_option(self.raw_options, '--graph-dir')
+        if '--graph' in self.options or graph_dir != None:
+            LineGraph(self.approach_rate_graph, self.track_ped, self.track_car, self.record_times(),
+                self.car.acceleration_graph, self.car.distance_to_ped_graph, self.approach_rate_time,
+                out_dir=graph_dir, auto_open=graph_dir == None)
         self.try_file_out()
 
     def try_file_out(self):
@@ -189,8 +392,8 @@ class Simulation(object):
         Output information in an output file of the users choosing.
         """
         file = None
-        for opt in self.options:
-            if '--file' in opt:
+        for opt in self.raw_options:
+            if '--file' in opt.lower():
                 file = opt
                 break
         if file == None:
@@ -200,14 +403,50 @@ class Simulation(object):
             return
         file = opt[1]
         with open(file, 'w') as export:
-            print(self.track_ped, file=export)
-            print(self.track_car, file=export)
+            write_series(self.track_ped, export)
+            write_series(self.track_car, export)
             print(self.total_time, file=export)
 
 
+def write_series(series, export):
+    """
+    Write a series the same way print() writes a list, one entry at a time
+    so a recorded series is never loaded into memory all at once.
+    """
+    export.write('[')
+    for i, entry in enumerate(series):
+        if i > 0:
+            export.write(', ')
+        export.write(repr(entry))
+    export.write(']\n')
+
+
 OPTIONS = list()
 
 
+def get_option(options, name, default=None):
+    """
+    Value of an option given as '--name=value'.
+    """
+    for opt in options:
+        if opt.startswith(name + '='):
+            return opt.split('=', 1)[1]
+    return default
+
+
+def tick_rate(rate, dt):
+    """
+    A (period, phase) in ms as (period, phase) in ticks of 'dt' ms. Work done every ms is done every tick,
+    anything else has to fall on tick boundaries: 'dt' must divide the period and phase + 1.
+    """
+    period, phase = rate
+    if period == 1 and phase == 0:
+        return 1, 0
+    if period % dt != 0 or (phase + 1) % dt != 0:
+        raise ValueError("Rate {} (ms) does not fall on the ticks of a {} ms time step".format(rate, dt))
+    return period//dt, (phase + 1)//dt - 1
+
+
 def get_milli():
     """
     The miliseconds from the epoch..
@@ -231,7 +470,10 @@ def main():
     """
     global OPTIONS
     populate_options()
-    sim = Simulation("Case1", options=OPTIONS)
+    recorder = None
+    if get_option(OPTIONS, '--spill') != None:
+        recorder = Recorder(get_option(OPTIONS, '--spill'), compress='--spill-compress' in OPTIONS)
+    sim = Simulation("Case1", options=OPTIONS, recorder=recorder)
     sim.add_car("car", 0, 0, 13.9, 0) # car starts at (0, 0) with velocity in positive x at 13.9m/s
     sim.add_pedestrian("ped", 35, -7, 0, 1.67) # ped at (35, -7) with velocity in positive y at 1.67m/s
     sim.add_path("ped", 'test_path.txt')
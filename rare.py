@@ -0,0 +1,154 @@
+#######################################################
+#
+# Estimate the probability of rare impacts with
+# cross-entropy importance sampling.
+#
+#######################################################
+
+import sys
+import multiprocessing
+import numpy as np
+from boundary import DEFAULTS, make_scenario
+from sweep import run_scenario
+from pedac import get_option
+
+# Nominal pedestrian behaviour, independent normals: name -> (mean, standard deviation)
+NOMINAL = dict(ped_x=(60.0, 10.0), ped_y=(-20.0, 2.0), ped_speed=(1.2, .15))
+
+
+def score_at(job):
+    """
+    Pool entry point: 0 for an impact, otherwise the closest the car got to the pedestrian.
+    Lower is more dangerous.
+    """
+    params, time_out = job
+    if params['ped_x'] <= 0:
+        # The car has to start left of the pedestrian, count it as far away.
+        return float('inf')
+    result = run_scenario(make_scenario(params, time_out=time_out))
+    if result['impact']:
+        return 0.0
+    return result['min_separation']
+
+
+def log_density(x, mean, std):
+    """
+    Sum over the columns of the log normal densities.
+    """
+    z = (x - mean)/std
+    return np.sum(-.5*z**2 - np.log(std), axis=1)
+
+
+class CrossEntropyEstimator(object):
+    """
+    Cross-entropy importance sampling of P(impact) under the NOMINAL distribution.
+    Each round samples from the current proposal, keeps the 'rho' most dangerous
+    samples and refits the proposal to them (weighted by likelihood ratios),
+    until the dangerous level reaches an impact. The final estimate reweights
+    impacts sampled from that proposal.
+    """
+    def __init__(self, nominal=None, fixed=None, samples=200, rho=.1, max_rounds=10, final_samples=1000,
+            time_out=60000, processes=None, seed=0):
+        self.nominal = dict(NOMINAL) if nominal == None else nominal
+        self.names = sorted(self.nominal)
+        self.fixed = dict(DEFAULTS)
+        if fixed != None:
+            self.fixed.update(fixed)
+        self.mean0 = np.array([self.nominal[n][0] for n in self.names])
+        self.std0 = np.array([self.nominal[n][1] for n in self.names])
+        self.mean = self.mean0.copy()
+        self.std = self.std0.copy()
+        self.samples = samples
+        self.rho = rho
+        self.max_rounds = max_rounds
+        self.final_samples = final_samples
+        self.time_out = time_out
+        self.processes = processes
+        self.rng = np.random.default_rng(seed)
+        self.runs = 0
+        self.levels = list()
+
+    def sample(self, n):
+        return self.mean + self.std*self.rng.standard_normal((n, len(self.names)))
+
+    def weights(self, x):
+        """
+        Likelihood ratios nominal/proposal.
+        """
+        return np.exp(log_density(x, self.mean0, self.std0) - log_density(x, self.mean, self.std))
+
+    def scores(self, pool, x):
+        jobs = list()
+        for row in x:
+            params = dict(self.fixed)
+            params.update(zip(self.names, (float(v) for v in row)))
+            jobs.append((params, self.time_out))
+        self.runs += len(jobs)
+        if pool == None:
+            return np.array([score_at(job) for job in jobs])
+        return np.array(pool.map(score_at, jobs))
+
+    def run(self):
+        """
+        \return (estimate, relative error) of P(impact)
+        """
+        pool = None if self.processes == 1 else multiprocessing.Pool(self.processes)
+        try:
+            for _ in range(self.max_rounds):
+                x = self.sample(self.samples)
+                s = self.scores(pool, x)
+                level = max(float(np.quantile(s, self.rho)), 0.0)
+                self.levels.append(level)
+                elite = s <= level
+                w = self.weights(x[elite])
+                if w.sum() == 0:
+                    break
+                self.mean = np.sum(w[:, None]*x[elite], axis=0)/w.sum()
+                var = np.sum(w[:, None]*(x[elite] - self.mean)**2, axis=0)/w.sum()
+                # Keep some spread so one lucky round can't collapse the proposal.
+                self.std = np.maximum(np.sqrt(var), self.std0*.05)
+                if level == 0:
+                    break
+            x = self.sample(self.final_samples)
+            s = self.scores(pool, x)
+        finally:
+            if pool != None:
+                pool.close()
+                pool.join()
+        terms = (s <= 0)*self.weights(x)
+        self.estimate = float(terms.mean())
+        self.relative_error = float(terms.std()/(np.sqrt(len(terms))*self.estimate)) if self.estimate > 0 else float('inf')
+        return self.estimate, self.relative_error
+
+    def plain_runs_needed(self):
+        """
+        Runs plain random sampling would need for the same relative error.
+        """
+        p = self.estimate
+        if p <= 0 or self.relative_error == float('inf'):
+            return None
+        return int((1 - p)/(p*self.relative_error**2))
+
+    def proposal(self):
+        return dict((n, (float(m), float(s))) for n, m, s in zip(self.names, self.mean, self.std))
+
+
+def main():
+    """
+    python rare.py [--samples=200] [--final=1000] [--processes=N] [--seed=0]
+    """
+    options = sys.argv[1:]
+    processes = get_option(options, '--processes')
+    estimator = CrossEntropyEstimator(samples=int(get_option(options, '--samples', 200)),
+        final_samples=int(get_option(options, '--final', 1000)), seed=int(get_option(options, '--seed', 0)),
+        processes=int(processes) if processes != None else None)
+    estimate, error = estimator.run()
+    print("P(impact) = {:.3e} (relative error {:.1%})".format(estimate, error))
+    print("Levels: {}".format(", ".join("{:.2f}".format(l) for l in estimator.levels)))
+    print("Final proposal: {}".format(estimator.proposal()))
+    print("{} simulation runs, plain sampling would need about {} for the same error".format(
+        estimator.runs, estimator.plain_runs_needed()))
+
+
+if __name__ == "__main__":
+    main()
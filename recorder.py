@@ -0,0 +1,250 @@
+#######################################################
+#
+# Bounded memory recording of simulation data.
+#
+#######################################################
+
+import os
+import json
+import zlib
+import queue
+import threading
+from array import array
+from objects import Pos
+
+
+class ChunkStore(object):
+    """
+    Directory of chunk files written by a background thread.
+    At most 'max_pending' chunks wait in memory for the writer, after that
+    the simulation blocks until the disk catches up.
+    """
+    def __init__(self, directory, compress=False, max_pending=4):
+        self.directory = directory
+        self.compress = compress
+        self.error = None
+        self.pending = queue.Queue(maxsize=max_pending)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.thread = None
+
+    def __getstate__(self):
+        # Only the location of the chunks travels between processes.
+        state = self.__dict__.copy()
+        state['pending'] = None
+        state['thread'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pending = queue.Queue(maxsize=4)
+
+    def start(self):
+        if self.thread == None:
+            self.thread = threading.Thread(target=self.loop, name="chunk-writer")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def path(self, name, index):
+        ext = '.bin.z' if self.compress else '.bin'
+        return os.path.join(self.directory, "{}-{:06d}{}".format(name, index, ext))
+
+    def loop(self):
+        while True:
+            job = self.pending.get()
+            if job == None:
+                return
+            name, index, data = job
+            try:
+                if self.compress:
+                    data = zlib.compress(data, 1)
+                with open(self.path(name, index), 'wb') as out:
+                    out.write(data)
+            except Exception as e:
+                self.error = e
+
+    def put(self, name, index, data):
+        """
+        Queue a chunk to be written.
+        """
+        if self.error != None:
+            raise self.error
+        self.start()
+        self.pending.put((name, index, data))
+
+    def read(self, name, index):
+        with open(self.path(name, index), 'rb') as f:
+            data = f.read()
+        if self.compress:
+            data = zlib.decompress(data)
+        return data
+
+    def flush(self):
+        """
+        Wait for every queued chunk to be on disk.
+        """
+        if self.thread != None:
+            self.pending.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.error != None:
+            raise self.error
+
+
+def encode_track(value):
+    pos, speed = value
+    return (pos.x, pos.y, pos.z, speed)
+
+
+def decode_track(values):
+    return (Pos(values[0], values[1], values[2]), values[3])
+
+
+class RecordedSeries(object):
+    """
+    A list like series that only keeps the newest chunk in memory.
+    Full chunks are handed to the store, reading goes through the chunk files.
+    Each entry is stored as 'width' doubles.
+    """
+    def __init__(self, store, name, kind='values', chunk_size=65536, length=0):
+        self.store = store
+        self.name = name
+        self.kind = kind
+        self.width = 4 if kind == 'track' else 1
+        self.chunk_size = chunk_size
+        self.length = length
+        self.flushed = length # entries that are in chunk files
+        self.buffer = array('d')
+        self.cache = (None, None) # (chunk index, decoded chunk) of the last read
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return "RecordedSeries({}, {} entries)".format(self.name, self.length)
+
+    def append(self, value):
+        if self.width == 1:
+            self.buffer.append(value)
+        else:
+            self.buffer.extend(encode_track(value))
+        self.length += 1
+        if len(self.buffer) >= self.chunk_size*self.width:
+            self.spill()
+
+    def spill(self):
+        """
+        Hand the buffered entries to the store.
+        """
+        if len(self.buffer) == 0:
+            return
+        self.store.put(self.name, self.flushed//self.chunk_size, self.buffer.tobytes())
+        self.flushed += len(self.buffer)//self.width
+        self.buffer = array('d')
+
+    def chunk_count(self):
+        return (self.flushed + self.chunk_size - 1)//self.chunk_size
+
+    def chunks(self):
+        """
+        The raw doubles chunk by chunk, oldest first.
+        """
+        for index in range(self.chunk_count()):
+            if self.cache[0] == index:
+                yield self.cache[1]
+                continue
+            data = array('d')
+            data.frombytes(self.store.read(self.name, index))
+            yield data
+        if len(self.buffer) > 0:
+            yield self.buffer
+
+    def decode(self, data):
+        if self.width == 1:
+            return data
+        return [decode_track(data[i:i + 4]) for i in range(0, len(data), 4)]
+
+    def __iter__(self):
+        for data in self.chunks():
+            for value in self.decode(data):
+                yield value
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.length
+        if i < 0 or i >= self.length:
+            raise IndexError("RecordedSeries index out of range")
+        if i >= self.flushed:
+            data = self.buffer
+            j = i - self.flushed
+        else:
+            index = i//self.chunk_size
+            if self.cache[0] != index:
+                data = array('d')
+                data.frombytes(self.store.read(self.name, index))
+                self.cache = (index, data)
+            data = self.cache[1]
+            j = i - index*self.chunk_size
+        if self.width == 1:
+            return data[j]
+        return decode_track(data[j*4:j*4 + 4])
+
+
+class Recorder(object):
+    """
+    Records simulation series to a directory with a fixed amount of memory.
+    """
+    def __init__(self, directory, chunk_size=65536, compress=False):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.store = ChunkStore(directory, compress)
+        self.series = dict()
+        self.info = dict()
+
+    def track(self, name):
+        """
+        Series of (Pos, speed) entries.
+        """
+        return self.add_series(name, 'track')
+
+    def values(self, name):
+        """
+        Series of plain numbers.
+        """
+        return self.add_series(name, 'values')
+
+    def add_series(self, name, kind):
+        series = RecordedSeries(self.store, name, kind, self.chunk_size)
+        self.series[name] = series
+        return series
+
+    def close(self, info=None):
+        """
+        Write out everything still in memory and the manifest describing the run.
+        """
+        for series in self.series.values():
+            series.spill()
+        self.store.flush()
+        if info != None:
+            self.info = info
+        manifest = dict(chunk_size=self.chunk_size, compress=self.store.compress, info=self.info,
+            series=dict((name, dict(kind=s.kind, length=s.length)) for name, s in self.series.items()))
+        with open(os.path.join(self.directory, 'manifest.json'), 'w') as out:
+            json.dump(manifest, out, indent=1)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Open a recording written by close().
+        """
+        with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+            manifest = json.load(f)
+        recorder = cls(directory, manifest['chunk_size'], manifest['compress'])
+        recorder.info = manifest['info']
+        for name, s in manifest['series'].items():
+            recorder.series[name] = RecordedSeries(recorder.store, name, s['kind'],
+                manifest['chunk_size'], s['length'])
+        return recorder
+
+    def __getitem__(self, name):
+        return self.series[name]
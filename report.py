@@ -0,0 +1,293 @@
+#######################################################
+#
+# Summary report of a sweep, built from its results file.
+#
+#######################################################
+
+import os
+import sys
+import json
+import time
+import heapq
+from html import escape
+from latency import LatencyHistogram
+from pedac import get_option
+
+
+class ResultsFile(object):
+    """
+    Appends scenario results to a file as JSON lines as they finish.
+    """
+    def __init__(self, filename):
+        directory = os.path.dirname(filename)
+        if directory != '' and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.filename = filename
+        self.file = open(filename, 'w')
+
+    def write(self, result):
+        line = dict(result)
+        line.setdefault('finished', time.time())
+        self.file.write(json.dumps(line) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_results(filename):
+    """
+    The results in a results file, one at a time.
+    """
+    with open(filename, 'r') as file:
+        for line in file:
+            if line.strip() != '':
+                yield json.loads(line)
+
+
+class Bins(object):
+    """
+    Fixed width histogram, values outside [low, high) go to the first or last bin.
+    """
+    def __init__(self, low, high, count=20):
+        self.low = low
+        self.high = high
+        self.width = (high - low)/float(count)
+        self.counts = [0]*count
+
+    def add(self, value):
+        i = int((value - self.low)//self.width)
+        self.counts[min(max(i, 0), len(self.counts) - 1)] += 1
+
+    def to_dict(self):
+        return dict(low=self.low, high=self.high, counts=self.counts)
+
+
+class Stats(object):
+    """
+    Running count, mean, min and max.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min == None else min(self.min, value)
+        self.max = value if self.max == None else max(self.max, value)
+
+    def to_dict(self):
+        return dict(count=self.count, mean=self.total/self.count if self.count > 0 else None,
+            min=self.min, max=self.max)
+
+
+class SweepReport(object):
+    """
+    Everything in the report, updated one result at a time so memory doesn't grow with the sweep:
+    the outcomes, efficiency and minimum distance histograms, the 'worst' most dangerous
+    scenarios and the run time statistics.
+    """
+    def __init__(self, worst=20, separation_max=10.0, bins=20, errors=10):
+        """
+        \param separation_max: top of the minimum distance histogram in m, larger ones go in the last bin
+        \param errors: number of failed scenarios listed
+        """
+        self.outcomes = dict((o, dict(efficiency=Stats(), total_time=Stats())) for o in ('impact', 'safe'))
+        self.failed = 0
+        self.errors = list()
+        self.max_errors = errors
+        self.efficiency = Bins(0, 100, bins)
+        self.separation = Bins(0, separation_max, bins)
+        self.worst_count = worst
+        self.worst = list() # heap of (danger, count, entry), least dangerous first
+        self.elapsed = LatencyHistogram() # ns per scenario
+        self.workers = dict() # worker -> [scenarios, ticks, busy seconds]
+        self.ticks = 0
+        self.start = None
+        self.end = None
+        self.count = 0
+
+    def add(self, result):
+        self.count += 1
+        if 'finished' in result:
+            started = result['finished'] - result.get('elapsed', 0)
+            self.start = started if self.start == None else min(self.start, started)
+            self.end = result['finished'] if self.end == None else max(self.end, result['finished'])
+        if 'error' in result:
+            self.failed += 1
+            if len(self.errors) < self.max_errors:
+                self.errors.append(dict(name=result['name'], error=result['error']))
+            return
+        outcome = self.outcomes['impact' if result['impact'] else 'safe']
+        outcome['efficiency'].add(result['efficiency'])
+        outcome['total_time'].add(result['total_time']/1000.0)
+        self.efficiency.add(result['efficiency'])
+        separation = result.get('min_separation')
+        if separation != None:
+            self.separation.add(separation)
+        self.ticks += result['ticks']
+        self.elapsed.record(result['elapsed']*1e9)
+        worker = self.workers.setdefault(str(result['worker']), [0, 0, 0.0])
+        worker[0] += 1
+        worker[1] += result['ticks']
+        worker[2] += result['elapsed']
+
+        # Impacts first, then the closest passes.
+        danger = (1 if result['impact'] else 0, -separation if separation != None else float('-inf'))
+        entry = dict((k, result.get(k)) for k in ('name', 'impact', 'efficiency', 'total_time',
+            'min_separation', 'detection_time', 'peak_deceleration', 'record', 'graphs'))
+        item = (danger, self.count, entry)
+        if len(self.worst) < self.worst_count:
+            heapq.heappush(self.worst, item)
+        elif item[0] > self.worst[0][0]:
+            heapq.heapreplace(self.worst, item)
+
+    def summary(self):
+        wall = self.end - self.start if self.start != None else None
+        us = 1e3
+        return dict(
+            scenarios=self.count, failed=self.failed, errors=self.errors,
+            outcomes=dict((o, dict(count=s['efficiency'].count, efficiency=s['efficiency'].to_dict(),
+                total_time=s['total_time'].to_dict())) for o, s in self.outcomes.items()),
+            efficiency=self.efficiency.to_dict(), min_separation=self.separation.to_dict(),
+            worst=[entry for danger, count, entry in sorted(self.worst, reverse=True)],
+            throughput=dict(wall_s=wall, ticks=self.ticks,
+                scenarios_per_s=self.count/wall if wall else None, ticks_per_s=self.ticks/wall if wall else None,
+                scenario_s=dict(mean=self.elapsed.mean()/1e9, p50=self.elapsed.percentile(50)/1e9,
+                    p90=self.elapsed.percentile(90)/1e9, p99=self.elapsed.percentile(99)/1e9,
+                    max=self.elapsed.max/1e9)),
+            workers=dict((w, dict(scenarios=n, ticks=t, busy_s=b, ticks_per_s=t/b if b > 0 else None))
+                for w, (n, t, b) in self.workers.items()))
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        report = cls(**kwargs)
+        for result in read_results(filename):
+            report.add(result)
+        return report
+
+    def write(self, out):
+        """
+        Write 'out.json' and 'out.html'. Links to the recordings and graphs are made relative to 'out'.
+        """
+        summary = self.summary()
+        with open(out + '.json', 'w') as file:
+            json.dump(summary, file, indent=1)
+        with open(out + '.html', 'w') as file:
+            file.write(render_html(summary, os.path.dirname(os.path.abspath(out))))
+
+
+# Graphs of a run linked from the worst scenarios, see graphs.LineGraph.
+TRAJECTORY_GRAPHS = [('x', 'x-positional-graph.html'), ('y', 'y-positional-graph.html'),
+    ('distance', 'distance-graph.html')]
+
+
+def fmt(value, spec="{:.2f}"):
+    return "-" if value == None else spec.format(value)
+
+
+def bars(hist, unit):
+    """
+    A histogram as a table of CSS bars.
+    """
+    top = max(max(hist['counts']), 1)
+    width = (hist['high'] - hist['low'])/float(len(hist['counts']))
+    rows = list()
+    for i, n in enumerate(hist['counts']):
+        low = hist['low'] + i*width
+        label = "{:.1f}-{:.1f} {}".format(low, low + width, unit)
+        if i == len(hist['counts']) - 1:
+            label = ">= {:.1f} {}".format(low, unit)
+        rows.append('<tr><td>{}</td><td><div class="bar" style="width:{:.1f}%"></div></td><td>{}</td></tr>'.format(
+            label, 100.0*n/top, n))
+    return '<table class="hist">{}</table>'.format(''.join(rows))
+
+
+def link(target, base, text):
+    if target == None:
+        return ''
+    return '<a href="{}">{}</a>'.format(escape(os.path.relpath(target, base)), text)
+
+
+def render_html(summary, base):
+    """
+    The report as a single html page.
+    \param base: directory of the page, links are relative to it
+    """
+    parts = ['<html><head><meta charset="utf-8"><title>Sweep report</title><style>',
+        'body{font-family:sans-serif} td,th{padding:2px 8px;text-align:right} ',
+        '.bar{background:rgb(0, 20, 200);height:12px} .hist td:nth-child(2){width:300px;text-align:left}',
+        '</style></head><body>', '<h1>Sweep report</h1>']
+
+    parts.append('<h2>Outcomes</h2><table><tr><th>Outcome</th><th>Scenarios</th><th>Mean efficiency %</th>'
+        '<th>Mean time s</th><th>Min time s</th><th>Max time s</th></tr>')
+    for name in ('impact', 'safe'):
+        o = summary['outcomes'][name]
+        parts.append('<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'.format(
+            name, o['count'], fmt(o['efficiency']['mean']), fmt(o['total_time']['mean'], "{:.3f}"),
+            fmt(o['total_time']['min'], "{:.3f}"), fmt(o['total_time']['max'], "{:.3f}")))
+    parts.append('<tr><td>failed</td><td>{}</td></tr></table>'.format(summary['failed']))
+
+    parts.append('<h2>Efficiency</h2>' + bars(summary['efficiency'], '%'))
+    parts.append('<h2>Minimum distance</h2>' + bars(summary['min_separation'], 'm'))
+
+    parts.append('<h2>Worst scenarios</h2><table><tr><th>Scenario</th><th>Outcome</th><th>Min distance m</th>'
+        '<th>Efficiency %</th><th>Detected s</th><th>Peak deceleration m/s^2</th><th></th></tr>')
+    for w in summary['worst']:
+        links = list()
+        if w['graphs'] != None:
+            links += [link(os.path.join(w['graphs'], file), base, text) for text, file in TRAJECTORY_GRAPHS]
+        if w['record'] != None:
+            links.append(link(w['record'], base, 'recording'))
+        links = ' '.join(links)
+        parts.append('<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'.format(
+            escape(w['name']), 'impact' if w['impact'] else 'safe', fmt(w['min_separation'], "{:.3f}"),
+            fmt(w['efficiency']), fmt(w['detection_time'], "{:.3f}"), fmt(w['peak_deceleration']), links))
+    parts.append('</table>')
+
+    t = summary['throughput']
+    s = t['scenario_s']
+    parts.append('<h2>Run time</h2><table>')
+    for label, value in (("Wall time s", fmt(t['wall_s'])), ("Scenarios/s", fmt(t['scenarios_per_s'])),
+            ("Simulated ticks", t['ticks']), ("Ticks/s", fmt(t['ticks_per_s'], "{:.0f}")),
+            ("Scenario time s mean / p50 / p90 / p99 / max", " / ".join(fmt(s[k], "{:.3f}")
+                for k in ('mean', 'p50', 'p90', 'p99', 'max')))):
+        parts.append('<tr><td style="text-align:left">{}</td><td>{}</td></tr>'.format(label, value))
+    parts.append('</table><table><tr><th>Worker</th><th>Scenarios</th><th>Ticks</th><th>Busy s</th>'
+        '<th>Ticks/s</th></tr>')
+    for worker, w in sorted(summary['workers'].items()):
+        parts.append('<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'.format(
+            escape(worker), w['scenarios'], w['ticks'], fmt(w['busy_s']), fmt(w['ticks_per_s'], "{:.0f}")))
+    parts.append('</table>')
+
+    if len(summary['errors']) > 0:
+        parts.append('<h2>Failures</h2><table>')
+        for e in summary['errors']:
+            parts.append('<tr><td>{}</td><td style="text-align:left">{}</td></tr>'.format(
+                escape(e['name']), escape(e['error'])))
+        parts.append('</table>')
+    parts.append('</body></html>')
+    return '\n'.join(parts)
+
+
+def main():
+    """
+    python report.py results.jsonl [--out=report] [--worst=20]
+    """
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if len(args) != 1:
+        print("Usage: python report.py results.jsonl [--out=report] [--worst=20]")
+        return
+    out = get_option(sys.argv[1:], '--out', 'report')
+    start = time.time()
+    report = SweepReport.from_file(args[0], worst=int(get_option(sys.argv[1:], '--worst', 20)))
+    report.write(out)
+    print("Summarized {} scenarios in {:.2f} s: {}.html, {}.json".format(report.count, time.time() - start,
+        out, out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#######################################################
+#
+# Results of a simulation run.
+#
+#######################################################
+
+import numpy as np
+from recorder import Recorder
+
+COLUMNS = ['car_x', 'car_y', 'car_speed', 'ped_x', 'ped_y', 'ped_speed', 'distance',
+    'acceleration', 'brake']
+
+# Derived metrics that are pickled with a result, the per tick ones stay behind with the columns.
+METRICS = ['min_separation', 'detection_time', 'peak_deceleration', 'braking_profile', 'time_to_stop']
+
+
+def series_array(series):
+    """
+    All the doubles of a recorded series as one array.
+    """
+    chunks = [np.frombuffer(chunk, dtype=np.float64) for chunk in series.chunks()]
+    if len(chunks) == 0:
+        return np.zeros(0)
+    return np.concatenate(chunks)
+
+
+def track_columns(track):
+    """
+    (x, y, speed) arrays of an in memory list of (Pos, speed).
+    """
+    n = len(track)
+    x = np.fromiter((entry[0].x for entry in track), dtype=np.float64, count=n)
+    y = np.fromiter((entry[0].y for entry in track), dtype=np.float64, count=n)
+    speed = np.fromiter((entry[1] for entry in track), dtype=np.float64, count=n)
+    return x, y, speed
+
+
+def load_columns(directory):
+    """
+    The columns of a run written by recorder.Recorder.
+    \return info: the run information from the manifest (impact, efficiency, ...)
+    \return columns: dict of column name to array, one entry per recorded tick
+    """
+    recorder = Recorder.load(directory)
+    columns = dict()
+    car = series_array(recorder['track_car']).reshape(-1, 4)
+    ped = series_array(recorder['track_ped']).reshape(-1, 4)
+    columns['car_x'] = car[:, 0]
+    columns['car_y'] = car[:, 1]
+    columns['car_speed'] = car[:, 3]
+    columns['ped_x'] = ped[:, 0]
+    columns['ped_y'] = ped[:, 1]
+    columns['ped_speed'] = ped[:, 3]
+    columns['distance'] = series_array(recorder['distance_to_ped'])
+    columns['acceleration'] = series_array(recorder['acceleration'])
+    if 'brake' in recorder.series:
+        columns['brake'] = series_array(recorder['brake'])
+    else:
+        columns['brake'] = np.zeros(len(columns['acceleration']))
+    return recorder.info, columns
+
+
+class SimulationResult(object):
+    """
+    What a simulation run leaves behind: the outcome plus the recorded columns.
+    Derived metrics are computed from the columns on first access and cached.
+    Only the outcome and the cached metrics are pickled, never the columns. A run
+    kept in memory computes its metrics before it is pickled, the receiving side
+    of a run recorded to disk loads the columns again if it needs more.
+    """
+    def __init__(self, name, impact, efficiency, total_time, columns=None, record=None, stride=1, phase=0, dt=1):
+        """
+        \param total_time: simulated time in ms
+        \param columns: dict of column name to array (see COLUMNS)
+        \param record: directory of the recording, used when columns is None. Without either
+            only the outcome is known and the derived metrics are None.
+        \param stride, phase: the recorder rate in ms, entry k was recorded at the end of ms phase + k*stride
+        \param dt: time step of the run in ms. Over 1 ms the speed and acceleration are only seen at the end
+            of each tick and miss what happens inside it, so the metrics built on them are None.
+        """
+        self.name = name
+        self.impact = impact
+        self.efficiency = efficiency
+        self.total_time = total_time
+        self.columns = columns
+        self.record = record
+        self.stride = stride
+        self.phase = phase
+        self.dt = dt
+        self.latency = None # controller timings when the run had a latency monitor
+        self.latency_ok = None
+        self.cache = dict()
+
+    @classmethod
+    def from_simulation(cls, sim):
+        impact = sim.car.impact or sim.pedestrian.impact
+        # The recorder rate in ms, entry k covers the tick that ends at ms phase + k*stride + 1.
+        stride, phase = sim.tick_rates['recorder']
+        stride, phase = stride*sim.dt, (phase + 1)*sim.dt - 1
+        if not sim.recording:
+            # Nothing was recorded (Simulation.iter_ticks), only the outcome is known.
+            return cls(sim.name, impact, sim.efficiency, sim.total_time, stride=stride, phase=phase, dt=sim.dt)
+        if sim.recorder != None:
+            return cls(sim.name, impact, sim.efficiency, sim.total_time, record=sim.recorder.directory,
+                stride=stride, phase=phase, dt=sim.dt)
+        columns = dict()
+        columns['car_x'], columns['car_y'], columns['car_speed'] = track_columns(sim.track_car)
+        columns['ped_x'], columns['ped_y'], columns['ped_speed'] = track_columns(sim.track_ped)
+        columns['distance'] = np.array(sim.car.distance_to_ped_graph, dtype=np.float64)
+        columns['acceleration'] = np.array(sim.car.acceleration_graph, dtype=np.float64)
+        columns['brake'] = np.array(sim.car.brake_graph, dtype=np.float64)
+        return cls(sim.name, impact, sim.efficiency, sim.total_time, columns, stride=stride, phase=phase,
+            dt=sim.dt)
+
+    def __str__(self):
+        return "Result {}: {}, efficiency {:.2f} %, {} s".format(self.name,
+            "impact" if self.impact else "safe", self.efficiency, self.total_time/1000.0)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __getstate__(self):
+        if self.record == None and self.columns != None:
+            for name in METRICS:
+                getattr(self, name)
+        state = self.__dict__.copy()
+        state['columns'] = None
+        state['cache'] = dict((name, value) for name, value in self.cache.items() if name in METRICS)
+        return state
+
+    def column(self, name):
+        if self.columns == None:
+            if self.record == None:
+                raise ValueError("Result {} has no recorded columns".format(self.name))
+            info, self.columns = load_columns(self.record)
+        return self.columns[name]
+
+    def cached(self, name, fn):
+        if name not in self.cache:
+            if self.columns == None and self.record == None:
+                # Nothing recorded, or left behind when the result was pickled.
+                return None
+            self.cache[name] = fn()
+        return self.cache[name]
+
+    def seconds(self, index):
+        """
+        Simulated time in s at which column entry 'index' was recorded.
+        """
+        return (self.phase + index*self.stride + 1)/1000.0
+
+    @property
+    def separation(self):
+        """
+        Distance between the car and the pedestrian for every recorded tick (m).
+        """
+        return self.cached('separation', lambda: np.hypot(self.column('ped_x') - self.column('car_x'),
+            self.column('ped_y') - self.column('car_y')))
+
+    @property
+    def min_separation(self):
+        """
+        Closest the car came to the pedestrian (m).
+        """
+        return self.cached('min_separation', lambda: float(self.separation.min())
+            if len(self.separation) > 0 else None)
+
+    @property
+    def detection_time(self):
+        """
+        When the sensor first saw the pedestrian (s), None if it never did.
+        """
+        def compute():
+            seen = np.flatnonzero(self.column('distance') > 0)
+            return self.seconds(int(seen[0])) if len(seen) > 0 else None
+        return self.cached('detection_time', compute)
+
+    @property
+    def peak_deceleration(self):
+        """
+        Largest deceleration while breaking (m/s^2), 0 if the car never broke. None for dt over 1 ms.
+        """
+        if self.dt > 1:
+            return None
+        def compute():
+            braking = self.column('brake') > 0
+            if not braking.any():
+                return 0.0
+            return float(self.column('acceleration')[braking].max()*1000)
+        return self.cached('peak_deceleration', compute)
+
+    @property
+    def braking_profile(self):
+        """
+        Every stretch of breaking as (start s, end s, peak deceleration m/s^2). None for dt over 1 ms.
+        """
+        if self.dt > 1:
+            return None
+        def compute():
+            braking = (self.column('brake') > 0).astype(np.int8)
+            edges = np.diff(np.concatenate(([0], braking, [0])))
+            starts = np.flatnonzero(edges == 1)
+            ends = np.flatnonzero(edges == -1)
+            acc = self.column('acceleration')
+            return [(self.seconds(int(s)), self.seconds(int(e) - 1), float(acc[s:e].max()*1000))
+                for s, e in zip(starts, ends)]
+        return self.cached('braking_profile', compute)
+
+    @property
+    def time_to_stop(self):
+        """
+        Time from the first break until the car stood still (s), None if it never stopped or dt is over 1 ms.
+        """
+        if self.dt > 1:
+            return None
+        def compute():
+            braking = np.flatnonzero(self.column('brake') > 0)
+            if len(braking) == 0:
+                return None
+            first = int(braking[0])
+            stopped = np.flatnonzero(self.column('car_speed')[first:] <= 0.01)
+            if len(stopped) == 0:
+                return None
+            return self.seconds(first + int(stopped[0])) - self.seconds(first)
+        return self.cached('time_to_stop', compute)
+
+    def summary(self):
+        """
+        The outcome and derived metrics as a plain dict.
+        """
+        return dict(name=self.name, impact=self.impact, efficiency=self.efficiency,
+            total_time=self.total_time, min_separation=self.min_separation,
+            detection_time=self.detection_time, peak_deceleration=self.peak_deceleration,
+            time_to_stop=self.time_to_stop, latency=self.latency, latency_ok=self.latency_ok)
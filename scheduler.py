@@ -0,0 +1,76 @@
+#######################################################
+#
+# Multi-rate scheduling of the work done each tick.
+#
+#######################################################
+
+import heapq
+
+
+class PeriodicTask(object):
+    """
+    A piece of work that runs every 'period' ticks starting at tick 'phase'.
+    Tasks due on the same tick run in increasing 'order'.
+    """
+    def __init__(self, name, fn, period=1, phase=0, order=0):
+        if period < 1:
+            raise ValueError("Task {} needs a period of at least one tick".format(name))
+        self.name = name
+        self.fn = fn
+        self.period = period
+        self.phase = phase
+        self.order = order
+
+    def __str__(self):
+        return "Task {}: every {} ticks from tick {}".format(self.name, self.period, self.phase)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class Scheduler(object):
+    """
+    Runs periodic tasks. Tasks that run every tick are kept in a plain list,
+    the rest wait in a heap keyed on the next tick they are due so they cost
+    nothing on ticks where they don't fire.
+    """
+    def __init__(self):
+        self.every_tick = list()
+        self.heap = list()
+        self.count = 0 # tie breaker so tasks are never compared
+
+    def add(self, name, fn, period=1, phase=0, order=0):
+        """
+        Register 'fn' to be called every 'period' ticks starting at tick 'phase'.
+        """
+        task = PeriodicTask(name, fn, period, phase, order)
+        if period == 1 and phase == 0:
+            self.every_tick.append(task)
+            self.every_tick.sort(key=lambda t: t.order)
+        else:
+            heapq.heappush(self.heap, (phase, order, self.count, task))
+            self.count += 1
+        return task
+
+    def tasks(self):
+        return self.every_tick + [entry[3] for entry in sorted(self.heap)]
+
+    def run(self, tick):
+        """
+        Run every task due on 'tick'. Ticks must be run in increasing order.
+        """
+        heap = self.heap
+        if len(heap) == 0 or heap[0][0] > tick:
+            for task in self.every_tick:
+                task.fn()
+            return
+
+        due = list()
+        while len(heap) > 0 and heap[0][0] <= tick:
+            when, order, count, task = heapq.heappop(heap)
+            due.append(task)
+            heapq.heappush(heap, (when + task.period, order, count, task))
+        due.extend(self.every_tick)
+        due.sort(key=lambda t: t.order)
+        for task in due:
+            task.fn()
@@ -0,0 +1,201 @@
+#######################################################
+#
+# Local what-if query service with a warm simulator.
+#
+#   POST /query {"ped_x": 35, "ped_y": -7, "ped_speed": 1.67, "car_speed": 13.9,
+#                "trajectory": true, "points": 200}
+#   GET  /stats
+#
+#######################################################
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from boundary import DEFAULTS, make_scenario
+from pedac import get_option
+
+
+def run_query(params, trajectory, points, time_out):
+    """
+    Worker entry point: run the scenario for a query.
+    """
+    sim = make_scenario(params, time_out=time_out).build()
+    result = sim.run()
+    if result == None:
+        raise ValueError("Scenario is not valid, the car has to start left of the pedestrian")
+    answer = dict(result=result.summary())
+    if trajectory:
+        n = len(result.column('car_x'))
+        index = np.unique(np.linspace(0, n - 1, min(points, n)).astype(int)) if n > 0 else []
+        answer['trajectory'] = dict(
+            time=[result.seconds(int(i)) for i in index],
+            car=[[float(result.column('car_x')[i]), float(result.column('car_y')[i])] for i in index],
+            ped=[[float(result.column('ped_x')[i]), float(result.column('ped_y')[i])] for i in index])
+    return answer
+
+
+class QueryService(object):
+    """
+    Answers scenario queries from an LRU cache, joins identical queries that are
+    already running and runs the rest on a pool of warm worker processes.
+    """
+    def __init__(self, processes=None, cache_size=1024, time_out=60000, host='127.0.0.1', port=9437):
+        self.processes = processes if processes != None else os.cpu_count()
+        self.executor = ProcessPoolExecutor(self.processes)
+        self.cache_size = cache_size
+        self.time_out = time_out
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.inflight = dict() # key -> Future of a running query
+        self.latencies = deque(maxlen=10000) # seconds, most recent requests
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def reply(self, code, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == '/stats':
+                    self.reply(200, service.stats())
+                else:
+                    self.reply(404, dict(error="Unknown path {}".format(self.path)))
+
+            def do_POST(self):
+                if self.path != '/query':
+                    self.reply(404, dict(error="Unknown path {}".format(self.path)))
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    query = json.loads(self.rfile.read(length).decode('utf-8'))
+                    self.reply(200, service.query(query))
+                except (ValueError, KeyError) as e:
+                    self.reply(400, dict(error=str(e)))
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+
+    def key(self, query):
+        """
+        The cache key and the normalized arguments of a query.
+        """
+        params = dict(DEFAULTS)
+        for name in DEFAULTS:
+            if name in query:
+                params[name] = round(float(query[name]), 6)
+        unknown = [k for k in query if k not in DEFAULTS and k not in ('trajectory', 'points')]
+        if len(unknown) > 0:
+            raise ValueError("Unknown query fields {}".format(unknown))
+        trajectory = bool(query.get('trajectory', False))
+        points = int(query.get('points', 200)) if trajectory else 0
+        key = json.dumps([params, trajectory, points], sort_keys=True)
+        return key, params, trajectory, points
+
+    def query(self, query):
+        start = time.time()
+        key, params, trajectory, points = self.key(query)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                answer = dict(self.cache[key], cached=True)
+                self.latencies.append(time.time() - start)
+                return answer
+            future = self.inflight.get(key)
+            submitted = future == None
+            if submitted:
+                self.misses += 1
+                future = self.executor.submit(run_query, params, trajectory, points, self.time_out)
+                self.inflight[key] = future
+            else:
+                self.coalesced += 1
+        if submitted:
+            # Outside the lock, the callback runs right away if the future is already done.
+            future.add_done_callback(lambda f: self.finished(key, f))
+        answer = future.result()
+        self.latencies.append(time.time() - start)
+        return dict(answer, cached=False)
+
+    def finished(self, key, future):
+        with self.lock:
+            self.inflight.pop(key, None)
+            if future.exception() != None:
+                return
+            self.cache[key] = future.result()
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        def percentile(p):
+            if len(latencies) == 0:
+                return None
+            return latencies[min(int(p*len(latencies)), len(latencies) - 1)]*1000.0
+        with self.lock:
+            return dict(requests=len(latencies), hits=self.hits, misses=self.misses,
+                coalesced=self.coalesced, cached=len(self.cache), running=len(self.inflight),
+                p50_ms=percentile(.5), p99_ms=percentile(.99))
+
+    def warm(self):
+        """
+        Start the worker processes and import the simulator in them before the first query.
+        """
+        jobs = [self.executor.submit(run_query, dict(DEFAULTS), False, 0, self.time_out)
+            for _ in range(self.processes)]
+        for job in jobs:
+            job.result()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.executor.shutdown()
+
+
+def main():
+    """
+    python service.py [--port=port] [--processes=N] [--cache=entries]
+    """
+    options = sys.argv[1:]
+    processes = get_option(options, '--processes')
+    service = QueryService(processes=int(processes) if processes != None else None,
+        cache_size=int(get_option(options, '--cache', 1024)), port=int(get_option(options, '--port', 9437)))
+    service.warm()
+    print("Serving what-if queries on http://{}:{}/query".format(service.host, service.port))
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+#######################################################
+#
+# Run many simulation scenarios across processes.
+#
+#######################################################
+
+import os
+import sys
+import time
+import functools
+import multiprocessing
+from pedac import Simulation, get_option
+from objects import EXACT, EULER
+from recorder import Recorder
+from trajectory import PedestrianTrajectory, load_trajectory
+from metrics import *
+from graphs import render_run, downsample, OverlayGraph
+from report import ResultsFile, SweepReport
+
+
+class Scenario(object):
+    """
+    Everything needed to build one simulation. Plain data so it pickles cheaply.
+    """
+    def __init__(self, name, car=(0, 0, 13.9, 0), ped=(35, -7, 0, 1.67), paths=None,
+            time_out=1000000, options=None, record_dir=None, compress=False, rates=None, ped_trajectory=None):
+        """
+        \param car, ped: (x, y, dx, dy) with positions in m and rates in m/s
+        \param paths: list of (object name, path file)
+        \param record_dir: spill the recorded data to 'record_dir/name' instead of keeping it in memory
+        \param rates: task rates overriding pedac.DEFAULT_RATES (e.g. dict(sensor=50))
+        \param ped_trajectory: replay the pedestrian from this trajectory file (see share_pedestrians)
+        """
+        self.name = name
+        self.car = tuple(car)
+        self.ped = tuple(ped)
+        self.paths = list() if paths == None else [tuple(p) for p in paths]
+        self.time_out = time_out
+        self.options = ['--quiet'] if options == None else list(options)
+        self.record_dir = record_dir
+        self.compress = compress
+        self.rates = rates
+        self.ped_trajectory = ped_trajectory
+
+    def __str__(self):
+        return "Scenario {}: car {} ped {}".format(self.name, self.car, self.ped)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def to_dict(self):
+        return dict(name=self.name, car=list(self.car), ped=list(self.ped),
+            paths=[list(p) for p in self.paths], time_out=self.time_out, options=self.options,
+            record_dir=self.record_dir, compress=self.compress, rates=self.rates,
+            ped_trajectory=self.ped_trajectory)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def build(self):
+        """
+        Create the simulation for this scenario.
+        """
+        recorder = None
+        if self.record_dir != None:
+            recorder = Recorder(os.path.join(self.record_dir, self.name), compress=self.compress)
+        sim = Simulation(self.name, options=self.options, time_out=self.time_out, recorder=recorder,
+            rates=self.rates)
+        sim.add_car("car", *self.car)
+        if self.ped_trajectory != None:
+            sim.add_replay_pedestrian("ped", load_trajectory(self.ped_trajectory))
+        else:
+            sim.add_pedestrian("ped", *self.ped)
+        for name, file in self.paths:
+            sim.add_path(name, file)
+        return sim
+
+
+def _compute_trajectory(job):
+    """
+    Pool entry point for share_pedestrians.
+    """
+    filename, ped, paths, ticks = job
+    PedestrianTrajectory.compute(filename, ped, paths, ticks)
+    return filename
+
+
+def share_pedestrians(scenarios, directory, ticks=20000, processes=None):
+    """
+    Precompute the pedestrian once for every group of scenarios that only differ in
+    the car or the controller, and make them replay it (Scenario.ped_trajectory).
+    Scenarios with a pedestrian of their own are left alone. The trajectories are
+    computed on a pool and written to 'directory'. Beyond 'ticks' the pedestrian is
+    stepped as usual.
+    \return number of trajectories computed
+    """
+    groups = dict()
+    for scenario in scenarios:
+        ped_paths = tuple(p for p in scenario.paths if p[0] == "ped")
+        groups.setdefault((scenario.ped, ped_paths), list()).append(scenario)
+    jobs = list()
+    for (ped, ped_paths), group in groups.items():
+        if len(group) < 2:
+            continue
+        filename = os.path.abspath(os.path.join(directory, "ped_{}.npy".format(len(jobs))))
+        jobs.append((filename, ped, ped_paths, min(ticks, max(s.time_out for s in group) + 1)))
+        for scenario in group:
+            scenario.ped_trajectory = filename
+    if processes == 1 or len(jobs) < 2:
+        for job in jobs:
+            _compute_trajectory(job)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            pool.map(_compute_trajectory, jobs)
+    return len(jobs)
+
+
+def run_scenario(scenario, graph_dir=None):
+    """
+    Run one scenario and return a small summary of the outcome (see SimulationResult.summary).
+    \param graph_dir: write the graphs of the run to 'graph_dir/name' right here, and return
+        downsampled trajectories for the overlay instead of the full tracks
+    """
+    start = time.time()
+    sim = scenario.build()
+    if sim.run() == None:
+        raise RuntimeError("Scenario {} did not validate".format(scenario.name))
+    result = sim.result.summary()
+    result.update(ticks=sim.total_time//sim.dt, elapsed=time.time() - start, worker=os.getpid())
+    if sim.recorder != None:
+        result['record'] = sim.recorder.directory
+    if graph_dir != None:
+        out_dir = os.path.join(graph_dir, scenario.name)
+        render_run((out_dir, sim.approach_rate_graph, sim.track_ped, sim.track_car, sim.record_times(),
+            sim.car.acceleration_graph, sim.car.distance_to_ped_graph, sim.approach_rate_time))
+        result['graphs'] = out_dir
+        result['overlay'] = (downsample((p.x, p.y) for p, speed in sim.track_car),
+            downsample((p.x, p.y) for p, speed in sim.track_ped))
+    return result
+
+
+def _run_safe(scenario, graph_dir=None):
+    """
+    Pool entry point. Errors are returned instead of raised so one bad scenario
+    doesn't take down the whole sweep.
+    """
+    try:
+        return run_scenario(scenario, graph_dir)
+    except Exception as e:
+        return dict(name=scenario.name, error=repr(e), worker=os.getpid())
+
+
+class Sweep(object):
+    """
+    A batch of scenarios run on a pool of worker processes.
+    """
+    def __init__(self, scenarios, processes=None, metrics=None, graph_dir=None, overlay_runs=50,
+            results_file=None):
+        """
+        \param graph_dir: write the graphs of every scenario to 'graph_dir/name' plus an
+            overlay of the first 'overlay_runs' trajectories. Each worker renders the runs it simulates.
+        \param results_file: append every result to this file as a JSON line (see report.py)
+        """
+        self.scenarios = list(scenarios)
+        self.processes = processes
+        self.metrics = metrics if metrics != None else SweepMetrics()
+        self.graph_dir = graph_dir
+        self.overlay_runs = overlay_runs
+        self.results_file = results_file
+        self.writer = None
+        self.overlays = list()
+        self.results = list()
+
+    def record(self, result):
+        """
+        Update the metrics with a finished (or failed) scenario.
+        """
+        if 'error' in result:
+            self.metrics.scenario_failed(result['worker'])
+        else:
+            self.metrics.scenario_done(result['worker'], result['ticks'], result['elapsed'],
+                result['impact'])
+        overlay = result.pop('overlay', None)
+        if overlay != None and len(self.overlays) < self.overlay_runs:
+            self.overlays.append((result['name'],) + tuple(overlay))
+        if self.writer != None:
+            self.writer.write(result)
+        self.results.append(result)
+
+    def run(self):
+        """
+        Run every scenario and return the results in completion order.
+        """
+        self.metrics.add_scenarios(len(self.scenarios))
+        if self.results_file != None:
+            self.writer = ResultsFile(self.results_file)
+        if self.processes == 1:
+            for scenario in self.scenarios:
+                self.record(_run_safe(scenario, self.graph_dir))
+        else:
+            with multiprocessing.Pool(self.processes) as pool:
+                for result in pool.imap_unordered(functools.partial(_run_safe, graph_dir=self.graph_dir), self.scenarios):
+                    self.record(result)
+        if self.graph_dir != None:
+            OverlayGraph(self.overlays, filename=os.path.join(self.graph_dir, 'overlay-graph.html'))
+        if self.writer != None:
+            self.writer.close()
+            self.writer = None
+        return self.results
+
+
+def grid_scenarios(xs, ys, paths=None, record_dir=None):
+    """
+    Scenarios with the pedestrian starting at every (x, y) in the grid.
+    """
+    scenarios = list()
+    for x in xs:
+        for y in ys:
+            name = "ped_{}_{}".format(x, y)
+            scenarios.append(Scenario(name, ped=(x, y, 0, 1.67), paths=paths, record_dir=record_dir))
+    return scenarios
+
+
+def timestep_error(dts=(2, 5, 10, 20), integrators=(EXACT, EULER), processes=None):
+    """
+    Error of longer time steps against the 1 ms reference, the table in the README.
+    The grid is the pedestrian at x 20-55 m and y -10 to -3 m, with the car at 10, 13.9 and 16 m/s.
+    \return one dict per (dt, integrator): outcome flips, max and median errors, speedup
+    """
+    grid = [(x, y, v) for x in range(20, 60, 5) for y in range(-10, -2) for v in (10, 13.9, 16)]
+    runs = [(1, EXACT)] + [(dt, integrator) for dt in dts for integrator in integrators]
+    scenarios = list()
+    for dt, integrator in runs:
+        for x, y, v in grid:
+            scenarios.append(Scenario("dt{}_{}_ped_{}_{}_car_{}".format(dt, integrator, x, y, v), car=(0, 0, v, 0),
+                ped=(x, y, 0, 1.67), paths=[("ped", "test_path.txt")], time_out=60000,
+                options=['--quiet', '--dt={}'.format(dt), '--integrator={}'.format(integrator)]))
+    results = dict((r['name'], r) for r in Sweep(scenarios, processes=processes).run())
+
+    def median(values):
+        return sorted(values)[len(values)//2]
+
+    rows = list()
+    for dt, integrator in runs[1:]:
+        pairs = [(results["dt1_{}_ped_{}_{}_car_{}".format(EXACT, x, y, v)],
+            results["dt{}_{}_ped_{}_{}_car_{}".format(dt, integrator, x, y, v)]) for x, y, v in grid]
+        efficiency = [abs(a['efficiency'] - b['efficiency']) for a, b in pairs]
+        separation = [abs(a['min_separation'] - b['min_separation']) for a, b in pairs]
+        rows.append(dict(dt=dt, integrator=integrator, scenarios=len(pairs),
+            flips=len([1 for a, b in pairs if a['impact'] != b['impact']]),
+            efficiency_max=max(efficiency), efficiency_median=median(efficiency),
+            total_time_max=max(abs(a['total_time'] - b['total_time']) for a, b in pairs),
+            separation_max=max(separation), separation_median=median(separation),
+            speedup=sum(a['elapsed'] for a, b in pairs)/sum(b['elapsed'] for a, b in pairs)))
+    return rows
+
+
+def main():
+    """
+    Sweep the pedestrian start position.
+    python sweep.py [--processes=N] [--metrics-file=filename] [--metrics-port=port] [--graph-dir=dir]
+        [--record-dir=dir] [--share-ped=dir] [--results=filename] [--report=out]
+    python sweep.py --timestep-error [--processes=N]
+    """
+    options = sys.argv[1:]
+    processes = get_option(options, '--processes')
+    processes = int(processes) if processes != None else None
+    if '--timestep-error' in options:
+        print("| dt (ms) | integrator | outcome flips | max / median efficiency error (%) | "
+            "max total time error (ms) | max / median min distance error (m) | speedup |")
+        print("|---|---|---|---|---|---|---|")
+        for row in timestep_error(processes=processes):
+            print("| {dt} | {integrator} | {flips} | {efficiency_max:.2f} / {efficiency_median:.2f} | "
+                "{total_time_max} | {separation_max:.3f} / {separation_median:.3f} | {speedup:.1f}x |".format(**row))
+        return
+    metrics = SweepMetrics()
+    writer = None
+    server = None
+    if get_option(options, '--metrics-file') != None:
+        writer = MetricsFileWriter(metrics, get_option(options, '--metrics-file')).start()
+    if get_option(options, '--metrics-port') != None:
+        server = MetricsServer(metrics, int(get_option(options, '--metrics-port'))).start()
+
+    scenarios = grid_scenarios(range(20, 60, 5), range(-10, -2), paths=[("ped", "test_path.txt")],
+        record_dir=get_option(options, '--record-dir'))
+    if get_option(options, '--share-ped') != None:
+        share_pedestrians(scenarios, get_option(options, '--share-ped'), processes=processes)
+    sweep = Sweep(scenarios, processes=processes, metrics=metrics,
+        graph_dir=get_option(options, '--graph-dir'), results_file=get_option(options, '--results'))
+    sweep.run()
+    if get_option(options, '--report') != None and sweep.results_file != None:
+        SweepReport.from_file(sweep.results_file).write(get_option(options, '--report'))
+
+    if writer != None:
+        writer.stop()
+    if server != None:
+        server.stop()
+    impacts = len([r for r in sweep.results if r.get('impact')])
+    failed = len([r for r in sweep.results if 'error' in r])
+    print("Ran {} scenarios: {} impacts, {} failed".format(len(sweep.results), impacts, failed))
+
+
+if __name__ == "__main__":
+    main()
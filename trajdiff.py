@@ -0,0 +1,120 @@
+#######################################################
+#
+# Compare recorded runs between two versions of the simulator.
+#
+#######################################################
+
+import os
+import sys
+import multiprocessing
+import numpy as np
+from results import load_columns
+from pedac import get_option
+
+# Largest difference that still counts as equal for each column.
+DEFAULT_TOLERANCES = dict(
+    car_x=1e-6, car_y=1e-6, car_speed=0.005,
+    ped_x=1e-6, ped_y=1e-6, ped_speed=0.005,
+    distance=1e-6, acceleration=1e-9,
+)
+
+
+def find_runs(directory):
+    """
+    Map of run name to directory for every recording under 'directory'.
+    """
+    runs = dict()
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(os.path.join(path, 'manifest.json')):
+            runs[name] = path
+    return runs
+
+
+def compare_runs(dir_a, dir_b, tolerances=None):
+    """
+    Compare two recordings of the same scenario tick by tick.
+    \return dict with the first tick where any column is out of tolerance (None if none),
+        the max deviation of every column and whether the outcome changed.
+    """
+    tolerances = DEFAULT_TOLERANCES if tolerances == None else tolerances
+    info_a, cols_a = load_columns(dir_a)
+    info_b, cols_b = load_columns(dir_b)
+    result = dict(name=info_a.get('name', os.path.basename(dir_a)),
+        ticks_a=len(cols_a['car_x']), ticks_b=len(cols_b['car_x']),
+        impact_a=info_a.get('impact'), impact_b=info_b.get('impact'),
+        efficiency_a=info_a.get('efficiency'), efficiency_b=info_b.get('efficiency'))
+    first = None
+    deviation = dict()
+    for name, tol in tolerances.items():
+        a, b = cols_a[name], cols_b[name]
+        n = min(len(a), len(b))
+        delta = np.abs(a[:n] - b[:n])
+        deviation[name] = float(delta.max()) if n > 0 else 0.0
+        bad = np.flatnonzero(delta > tol)
+        if len(bad) > 0 and (first == None or bad[0] < first):
+            first = int(bad[0])
+    if first == None and result['ticks_a'] != result['ticks_b']:
+        # Identical as far as both go but one run stopped earlier.
+        first = min(result['ticks_a'], result['ticks_b'])
+    result['first_divergence'] = first
+    result['max_deviation'] = deviation
+    result['outcome_flip'] = bool(result['impact_a']) != bool(result['impact_b'])
+    return result
+
+
+def _compare(args):
+    return compare_runs(*args)
+
+
+def compare_sets(dir_a, dir_b, tolerances=None, processes=None):
+    """
+    Compare every run recorded in both 'dir_a' and 'dir_b' (matched by name).
+    \return results: list of compare_runs results
+    \return only_a, only_b: names of runs missing from the other set
+    """
+    runs_a = find_runs(dir_a)
+    runs_b = find_runs(dir_b)
+    common = [name for name in runs_a if name in runs_b]
+    jobs = [(runs_a[name], runs_b[name], tolerances) for name in common]
+    if processes == 1:
+        results = [_compare(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_compare, jobs, chunksize=max(len(jobs)//64, 1))
+    only_a = [name for name in runs_a if name not in runs_b]
+    only_b = [name for name in runs_b if name not in runs_a]
+    return results, only_a, only_b
+
+
+def outcome(impact):
+    return "impact" if impact else "safe"
+
+
+def main():
+    """
+    python trajdiff.py dir_a dir_b [--processes=N]
+    """
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if len(args) != 2:
+        print("Usage: python trajdiff.py dir_a dir_b [--processes=N]")
+        return
+    processes = get_option(sys.argv[1:], '--processes')
+    processes = int(processes) if processes != None else None
+    results, only_a, only_b = compare_sets(args[0], args[1], processes=processes)
+    changed = [r for r in results if r['first_divergence'] != None or r['outcome_flip']]
+    changed.sort(key=lambda r: (not r['outcome_flip'], r['first_divergence']))
+    print("{:<30} {:>10} {:>12} {:>12} {:>18}".format("Scenario", "Diverges", "Max dist", "Max speed", "Outcome"))
+    for r in changed:
+        dev = r['max_deviation']
+        flip = "{} -> {}".format(outcome(r['impact_a']), outcome(r['impact_b'])) if r['outcome_flip'] else ""
+        print("{:<30} {:>10} {:>12.6f} {:>12.6f} {:>18}".format(r['name'], r['first_divergence'],
+            dev['distance'], max(dev['car_speed'], dev['ped_speed']), flip))
+    print("\n{} runs compared, {} changed, {} outcome flips".format(len(results), len(changed),
+        len([r for r in changed if r['outcome_flip']])))
+    if len(only_a) > 0 or len(only_b) > 0:
+        print("Only in {}: {}\nOnly in {}: {}".format(args[0], only_a, args[1], only_b))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#######################################################
+#
+# Precomputed pedestrian trajectories shared between runs.
+#
+#######################################################
+
+import os
+import json
+import numpy as np
+from objects import Pos, Velocity, SpaceObjectPath
+from ped import Pedestrian
+
+# Columns of a trajectory row, velocities and accelerations per tick like SpaceObject.
+COLUMNS = ['x', 'y', 'z', 'dx', 'dy', 'dz', 'ax', 'ay', 'az']
+
+TRAJECTORIES = dict()
+
+
+class PedestrianTrajectory(object):
+    """
+    The pedestrian state after every tick, row k is the state at time k.
+    The pedestrian never depends on the car, so every car or controller variant
+    of a scenario can replay the same trajectory. The rows are a .npy file that
+    is opened read-only with mmap, so the processes of a sweep share one copy
+    through the page cache. Next to it 'filename.json' keeps the pedestrian
+    and its paths, which are needed to keep going past the last row.
+    """
+    def __init__(self, filename, ped, paths, data):
+        self.filename = filename
+        self.ped = tuple(ped)
+        self.paths = [tuple(p) for p in paths]
+        self.data = data
+        # Flat view of the same mapping, slicing it is much cheaper than indexing the array.
+        self.flat = memoryview(data).cast('B').cast('d')
+        self.path = None
+        for name, file in self.paths:
+            self.path = SpaceObjectPath(name, file)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getstate__(self):
+        # Only the file name goes to other processes, they map it again.
+        return dict(filename=self.filename)
+
+    def __setstate__(self, state):
+        self.__dict__.update(load_trajectory(state['filename']).__dict__)
+
+    def row(self, tick):
+        """
+        (pos, velocity) at time 'tick'.
+        """
+        i = tick*len(COLUMNS)
+        x, y, z, dx, dy, dz = self.flat[i:i + 6].tolist()
+        return Pos(x, y, z), Velocity(dx, dy, dz)
+
+    def acceleration(self, tick):
+        i = tick*len(COLUMNS) + 6
+        return Velocity(*self.flat[i:i + 3].tolist())
+
+    @classmethod
+    def compute(cls, filename, ped, paths=None, ticks=60000):
+        """
+        Step a pedestrian on its own for 'ticks' ticks and write the trajectory.
+        \param ped: (x, y, dx, dy) with the position in m and the rates in m/s (see Simulation.add_pedestrian)
+        \param paths: list of (name, path file) of the pedestrian
+        """
+        paths = list() if paths == None else [tuple(p) for p in paths]
+        x, y, dx, dy = ped
+        pedestrian = Pedestrian(None, 'ped', .5, Pos(x, y, 0), Velocity(dx/1000.0, dy/1000.0, 0))
+        for name, file in paths:
+            path = SpaceObjectPath(name, file)
+            if path.valid:
+                pedestrian.path = path
+        directory = os.path.dirname(filename)
+        if directory != '' and not os.path.isdir(directory):
+            os.makedirs(directory)
+        data = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64, shape=(ticks + 1, len(COLUMNS)))
+        for tick in range(ticks + 1):
+            p, v, a = pedestrian.pos, pedestrian.velocity, pedestrian.acceleration
+            data[tick] = (p.x, p.y, p.z, v.dx, v.dy, v.dz, a.dx, a.dy, a.dz)
+            pedestrian.tick()
+        data.flush()
+        del data
+        with open(filename + '.json', 'w') as file:
+            json.dump(dict(ped=list(ped), paths=[list(p) for p in paths], ticks=ticks), file)
+        TRAJECTORIES.pop(os.path.abspath(filename), None)
+        return load_trajectory(filename)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename + '.json', 'r') as file:
+            meta = json.load(file)
+        return cls(filename, meta['ped'], meta['paths'], np.load(filename, mmap_mode='r'))
+
+
+def load_trajectory(filename):
+    """
+    The trajectory in 'filename', mapped once per process.
+    """
+    filename = os.path.abspath(filename)
+    if filename not in TRAJECTORIES:
+        TRAJECTORIES[filename] = PedestrianTrajectory.load(filename)
+    return TRAJECTORIES[filename]